@@ -0,0 +1,54 @@
+# Compare roll insertion throughput when committing every write against
+# grouping writes into transactions. Usage: python src/bench_database.py [n]
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import database
+import utilities
+
+
+class Snowflake:
+    def __init__(self, idno):
+        self.id = idno
+
+
+async def rolls_per_second(file, n, flush_interval, batch_size):
+    await database.init_db(file, flush_interval, batch_size)
+    db = database.Roll_Database()
+    user, server = Snowflake(1), Snowflake(2)
+
+    start = time.perf_counter()
+    for i in range(n):
+        await db.insert_roll("1d20", str(i % 20 + 1), user, server)
+    await database.database.sync()
+    elapsed = time.perf_counter() - start
+
+    await database.database.close()
+    return n / elapsed
+
+
+def main(n):
+    # Interfaces must exist before connecting so their tables are created.
+    database.Roll_Database()
+    database.Campaign_Database()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tmp:
+        utilities.set_log_file(os.path.join(tmp, ".log"))
+        before = loop.run_until_complete(
+            rolls_per_second(os.path.join(tmp, "before.db"), n, 0, 1)
+        )
+        after = loop.run_until_complete(
+            rolls_per_second(os.path.join(tmp, "after.db"), n, 0.05, 100)
+        )
+
+    print(f"Commit per write: {before:.0f} rolls/s")
+    print(f"Group commit:     {after:.0f} rolls/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,97 @@
+# Measure how long a message naming several cards takes to answer against a
+# local stub of Scryfall. Usage: python src/bench_scryfall.py [latency seconds]
+
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import scryfall
+import stub_scryfall
+import utilities
+
+CARDS = [
+    "Sol Ring",
+    "Lightning Bolt",
+    "Counterspell",
+    "Dark Ritual",
+    "Giant Growth",
+    "Swords to Plowshares",
+    "Brainstorm",
+    "Llanowar Elves",
+]
+
+
+class Typing:
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *_):
+        pass
+
+
+class Message:
+    ids = itertools.count()
+
+    def __init__(self, content, channel):
+        self.id = next(Message.ids)
+        self.content = content
+        self.channel = channel
+
+
+class Channel:
+    id = 0
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sent = []  # (seconds since start, embed title)
+
+    def typing(self):
+        return Typing()
+
+    async def send(self, embed=None):
+        self.sent.append((time.perf_counter() - self.start, embed.title))
+        return Message("", self)
+
+
+async def measure(query_limit):
+    scryfall.client.cache.flush()
+    handler = scryfall.ScryfallHandler(
+        {
+            "scryfall": True,
+            "scryfall_query_limit": query_limit,
+            # Measure concurrency alone, without waiting on the rate limit.
+            "scryfall_rate_limit": 1000,
+        }
+    )
+    channel = Channel()
+    content = " ".join(f"[{card}]" for card in CARDS)
+    await handler.handle(Message(content, channel))
+
+    assert [title for _, title in channel.sent] == CARDS
+    return channel.sent[0][0], channel.sent[-1][0]
+
+
+async def main(latency):
+    stub = stub_scryfall.StubScryfall(latency)
+    await stub.start()
+    try:
+        print(f"{len(CARDS)} cards, {latency * 1000:.0f}ms per request")
+        for limit in [1, 4, len(CARDS)]:
+            first, last = await measure(limit)
+            print(
+                f"{limit} at a time: first result after {first * 1000:.0f}ms, "
+                f"all after {last * 1000:.0f}ms"
+            )
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        utilities.set_log_file(os.path.join(tmp, ".log"))
+        asyncio.get_event_loop().run_until_complete(
+            main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.1)
+        )
@@ -0,0 +1,76 @@
+# Compare xkcd title lookups per second using the trigram index against
+# scanning every title with difflib. Usage: python src/bench_xkcd.py [n]
+
+import difflib
+import random
+import sys
+import time
+
+import xkcd
+
+WORDS = (
+    "the of a to in is you that it he was for on are as with his they at be "
+    "this have from or one had by word but not what all were we when your "
+    "can said there use an each which she do how their if will up other "
+    "about out many then them these so some her would make like him into "
+    "time has look two more write go see number no way could people my than "
+    "first water been call who oil its now find long down day did get come "
+    "made may part password compiling physics regex standards tasks"
+).split()
+
+
+def make_titles(n):
+    rand = random.Random(936)
+    return [
+        " ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 4)))
+        for _ in range(n)
+    ]
+
+
+def misspell(title, rand):
+    i = rand.randrange(len(title))
+    return title[:i] + title[i + 1 :]
+
+
+def scan(names, query):
+    # The lookup used before the index: an exact check then a linear scan.
+    if query in names:
+        return query
+    best, best_name = 0.5, None
+    for name in names:
+        r = difflib.SequenceMatcher(a=name, b=query).ratio()
+        if r > best:
+            best, best_name = r, name
+    return best_name
+
+
+def lookups_per_second(lookup, queries):
+    start = time.perf_counter()
+    for query in queries:
+        lookup(query)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main(n):
+    names = make_titles(3000)
+    index = xkcd.TitleIndex()
+    for i, name in enumerate(names):
+        index.add(i + 1, name)
+
+    rand = random.Random(327)
+    exact = [rand.choice(names) for _ in range(n)]
+    fuzzy = [misspell(rand.choice(names), rand) for _ in range(n)]
+
+    def indexed(query):
+        idno = index.lookup(query)
+        return idno if idno is not None else index.suggest(query)
+
+    print(f"{len(names)} titles, {n} lookups of each kind")
+    for kind, queries in [("exact", exact), ("misspelt", fuzzy)]:
+        before = lookups_per_second(lambda q: scan(names, q), queries)
+        after = lookups_per_second(indexed, queries)
+        print(f"{kind}: {before:.0f}/s scanning, {after:.0f}/s with the index")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
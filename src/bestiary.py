@@ -1,21 +1,31 @@
 import difflib
 
 import discord
-import requests
+
+import compendium
 
 
 class Bestiary:
-    def __init__(self, bestiary_url):
-        self.build_bestiary(bestiary_url)
+    LOADING_MESSAGE = (
+        "The bestiary is still loading. Please try again in a minute."
+    )
+
+    def __init__(self, data=None):
+        self.bestiary = {}
+        self.embeds = compendium.EmbedCache()
+        if data is not None:
+            self.build_bestiary(data)
 
-    def build_bestiary(self, bestiary_url):
+    def build_bestiary(self, data):
         try:
-            self.bestiary = {
-                beast["name"].lower(): beast
-                for beast in requests.get(bestiary_url).json()
-            }
+            self.bestiary = {beast["name"].lower(): beast for beast in data}
         except:
             raise ValueError
+        self.embeds.reset(self.render_embed)
+
+    def render_embed(self, key):
+        beast = self.bestiary.get(key)
+        return Bestiary.create_embed(beast) if beast is not None else None
 
     def get_beast(self, query):
         beast = difflib.get_close_matches(
@@ -27,11 +37,17 @@ class Bestiary:
             return None
 
     def handle_command(self, query):
+        # Nothing is loaded on a first start until the data is downloaded.
+        if not self.bestiary:
+            return Bestiary.LOADING_MESSAGE
+
         beast = self.get_beast(query)
         if beast is None:
             return f'Sorry, I couldn\'t find "{query}".'
         else:
-            return Bestiary.create_embed(beast)
+            return self.embeds.get(
+                beast["name"].lower(), lambda: Bestiary.create_embed(beast)
+            )
 
     @staticmethod
     def create_embed(beast):
@@ -30,6 +30,8 @@ class Bot:
         commands.No,
         commands.Reverse,
         roller.RollCommand,
+        scryfall.ScryfallAdmin,
+        scryfall.ScryfallDeck,
         commands.Spell,
         commands.VaporWave,
         commands.Weeb,
@@ -45,6 +47,7 @@ class Bot:
         self.client = client
 
         self.db = database.Discord_Database()
+        scryfall.configure(config)
 
         self.commands = {}
         for i in Bot.INSTRUCTIONS:
@@ -62,18 +65,37 @@ class Bot:
             except AssertionError:
                 utilities.log_message(f"{p} disabled.")
 
-        self.reaction_handlers = []
-        for h in self.patterns + list(self.commands.values()):
-            if h.monitors_reactions:
-                self.reaction_handlers.append(h)
+        commands.reaction_targets.capacity = config.get(
+            "reaction_cache_size", commands.reaction_targets.capacity
+        )
 
         self.token = config["token"]
 
-        loop.run_until_complete(database.init_db(config["db_file"]))
+        loop.run_until_complete(
+            database.init_db(
+                config["db_file"],
+                config.get("db_flush_interval"),
+                config.get("db_batch_size"),
+                config.get("db_wal", False),
+                config.get("db_readers", 2),
+            )
+        )
+        loop.run_until_complete(self.db.load_registry())
+        loop.create_task(
+            self.db.flush_periodically(
+                client, config.get("registry_interval", 60)
+            )
+        )
 
     def start(self):
         client.run(self.token)
 
+    # Commit everything still waiting to be written before the loop closes.
+    async def shutdown(self):
+        await self.db.flush(durable=True)
+        await database.database.close()
+        utilities.log_message("Closed database.")
+
     async def handle_command(self, message):
         if message.author == client.user or message.author.bot:
             return
@@ -187,9 +209,10 @@ class Bot:
 
             return
 
-        for h in self.reaction_handlers:
-            if reaction.message.id in h.reaction_targets:
-                await h.handle_reaction(reaction, user)
+        target = commands.reaction_targets.get(reaction.message.id)
+        if target is not None:
+            handler, payload = target
+            await handler.handle_reaction(reaction, user, payload)
 
     def log_message(self, message):
         guild_string = message.guild
@@ -208,12 +231,23 @@ class Bot:
             )
 
 
+class Client(discord.Client):
+    # discord.py closes the client whenever the bot stops, including on
+    # SIGINT and SIGTERM, before cancelling the remaining tasks and closing
+    # the event loop, so this is the last chance to save pending writes.
+    async def close(self):
+        if self.is_closed():
+            return
+        await super().close()
+        await bot.shutdown()
+
+
 intents = discord.Intents.default()
 intents.members = True
 intents.reactions = True
 
 loop = asyncio.get_event_loop()
-client = discord.Client(
+client = Client(
     loop=loop,
     intents=intents,
     activity=discord.Activity(name="you try --help", type=3),
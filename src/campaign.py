@@ -531,14 +531,14 @@ class Campaign:
         if tup is None:
             return None
 
-        name, dm, players, nicks, day, time, notify, channel = tup
+        name, dm, day, time, notify, channel, players = tup
 
         camp = Campaign(
             name,
             server,
             dm,
-            parse_player_string(players) if players else [],
-            [n.replace('"', "") for n in nicks.split(",")] if nicks else [],
+            [p for p, _ in players],
+            [n if n else "" for _, n in players],
             day,
             time,
             bool(notify),
@@ -548,10 +548,6 @@ class Campaign:
         return camp
 
 
-def parse_player_string(players):
-    return [int(p) for p in players.split(",")]
-
-
 class CampaignSwitcher(commands.Command):
     INSTRUCTIONS = [
         Add,
@@ -752,9 +748,7 @@ class CampaignSwitcher(commands.Command):
             reminders = await self.db.get_reminders(period, delta)
             for name, channel, players in reminders:
                 try:
-                    mention_string = " ".join(
-                        [f"<@{p}>" for p in parse_player_string(players)]
-                    )
+                    mention_string = " ".join([f"<@{p}>" for p in players])
 
                     channel = discord.utils.find(
                         lambda c: c.id == channel, client.get_all_channels()
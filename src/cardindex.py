@@ -0,0 +1,208 @@
+# A local index of Scryfall's bulk card data, used to answer card lookups
+# without a request to the API. See https://scryfall.com/docs/api/bulk-data
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+
+import utilities
+
+SEPARATOR = re.compile(r"[\s,]*")
+
+
+# Yield the items of a JSON array in file f without reading it all at once.
+def iter_json_array(f, chunk_size=1024 * 1024):
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array.")
+
+    pos = 1
+    while True:
+        pos = SEPARATOR.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+            yield item
+            continue
+        except ValueError:
+            pass
+
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ValueError("JSON array ended unexpectedly.")
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def normalise(name):
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+# Keep only the fields used by scryfall.card_from_scryfall_response.
+def slim(card):
+    data = {
+        "object": "card",
+        "name": card["name"],
+        "set": card["set"],
+        "color_identity": card.get("color_identity", []),
+        "prices": card.get("prices", {"usd": None, "usd_foil": None}),
+    }
+    if "image_uris" in card:
+        data["image_uris"] = card["image_uris"]
+    if "card_faces" in card:
+        data["card_faces"] = [
+            {k: f[k] for k in ["name", "image_uris"] if k in f}
+            for f in card["card_faces"]
+        ]
+    return data
+
+
+# Printings which aren't real cards, and so should never be the newest
+# printing of a name.
+SKIPPED_LAYOUTS = {
+    "art_series",
+    "token",
+    "double_faced_token",
+    "emblem",
+    "vanguard",
+    "planar",
+    "scheme",
+}
+
+
+def build_index(source, destination):
+    if os.path.isfile(destination):
+        os.remove(destination)
+
+    connection = sqlite3.connect(destination)
+    connection.execute(
+        "CREATE TABLE cards(name TEXT, ed TEXT, released TEXT, data TEXT);"
+    )
+
+    count = 0
+    rows = []
+    with open(source, "r", encoding="utf-8") as f:
+        for card in iter_json_array(f):
+            faces = card.get("card_faces", [{}])
+            if (
+                card.get("object") != "card"
+                or card.get("layout") in SKIPPED_LAYOUTS
+                or card.get("digital")
+                or not ("image_uris" in card or "image_uris" in faces[0])
+            ):
+                continue
+
+            data = json.dumps(slim(card))
+            names = {card["name"]}
+            names.update(f["name"] for f in card.get("card_faces", []))
+            for name in names:
+                rows.append(
+                    (
+                        normalise(name),
+                        card["set"],
+                        card.get("released_at"),
+                        data,
+                    )
+                )
+
+            count += 1
+            if len(rows) >= 1000:
+                connection.executemany(
+                    "INSERT INTO cards VALUES(?, ?, ?, ?);", rows
+                )
+                rows = []
+
+    connection.executemany("INSERT INTO cards VALUES(?, ?, ?, ?);", rows)
+    connection.execute("CREATE INDEX cards_name ON cards(name, ed, released);")
+    connection.commit()
+    connection.close()
+    return count
+
+
+class CardIndex:
+    MIN_PREFIX = 4  # shortest query which is matched as a name prefix
+
+    def __init__(self, path=None):
+        self.path = None
+        self.connection = None
+        if path is not None:
+            self.open(path)
+
+    def open(self, path):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+        self.path = path
+        if os.path.isfile(path):
+            self.connection = sqlite3.connect(path)
+
+    # Returns the Scryfall data of the newest printing of the card named
+    # query, or of the only card whose name starts with query.
+    def lookup(self, query, ed=None):
+        if self.connection is None:
+            return None
+
+        name = normalise(query)
+        if not name:
+            return None
+
+        data = self.newest(name, ed)
+        if data is None and len(name) >= CardIndex.MIN_PREFIX:
+            upper = name[:-1] + chr(ord(name[-1]) + 1)
+            names = self.connection.execute(
+                "SELECT DISTINCT name FROM cards "
+                "WHERE name > ? AND name < ? LIMIT 2;",
+                (name, upper),
+            ).fetchall()
+            if len(names) == 1:
+                data = self.newest(names[0][0], ed)
+
+        return json.loads(data) if data is not None else None
+
+    def newest(self, name, ed):
+        if ed:
+            row = self.connection.execute(
+                "SELECT data FROM cards WHERE name = ? AND ed = ? "
+                "ORDER BY released DESC LIMIT 1;",
+                (name, ed.lower()),
+            ).fetchone()
+        else:
+            row = self.connection.execute(
+                "SELECT data FROM cards WHERE name = ? "
+                "ORDER BY released DESC LIMIT 1;",
+                (name,),
+            ).fetchone()
+        return row[0] if row else None
+
+    # Build a new index from source in the background and swap it in.
+    async def refresh(self, source):
+        loop = asyncio.get_event_loop()
+        new_path = self.path + ".new"
+        count = await loop.run_in_executor(None, build_index, source, new_path)
+
+        if self.connection is not None:
+            self.connection.close()
+        os.replace(new_path, self.path)
+        self.connection = sqlite3.connect(self.path)
+        utilities.log_message(f"Indexed {count} cards from {source}.")
+
+    def is_stale(self, source):
+        return not os.path.isfile(self.path) or os.path.getmtime(
+            source
+        ) > os.path.getmtime(self.path)
+
+    async def refresh_periodically(self, source, interval, client):
+        await client.wait_until_ready()
+        while not client.is_closed():
+            if os.path.isfile(source) and self.is_stale(source):
+                try:
+                    await self.refresh(source)
+                except Exception as e:
+                    utilities.log_message(f"Failed to index {source}: {e}")
+            await asyncio.sleep(interval)
@@ -1,3 +1,4 @@
+import collections
 import difflib
 import random
 import re
@@ -5,6 +6,7 @@ import re
 import discord
 
 import bestiary
+import compendium
 import spellbook
 import utilities
 import wordart
@@ -22,10 +24,6 @@ class Command:
         self.delete_message = kwargs.get("delete_message", False)
         # This command will send responses itself rather than returning them
         self.will_send = kwargs.get("will_send", False)
-        # This command monitors reactions to its messages
-        self.monitors_reactions = kwargs.get("monitors_reactions", False)
-        # Ids of messages that this command would like to monitor for reactions
-        self.reaction_targets = kwargs.get("reaction_targets", [])
 
     async def _handle(self, _):
         raise NotImplementedError()
@@ -40,10 +38,43 @@ class Command:
     async def handle(self, message):
         return await self._handle(self.remove_command_string(message.content))
 
-    async def handle_reaction(self, reaction, user):
+    # Called with the payload given to reaction_targets.add when a message
+    # this command is monitoring is reacted to.
+    async def handle_reaction(self, reaction, user, payload):
         raise NotImplementedError()
 
 
+class ReactionTargets:
+    # Messages which commands are monitoring for reactions, mapped to the
+    # command and a payload of its choosing. Once there are more than
+    # capacity messages, the least recently used are forgotten.
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.targets = collections.OrderedDict()
+
+    def add(self, message_id, handler, payload=None):
+        self.targets[message_id] = (handler, payload)
+        self.targets.move_to_end(message_id)
+        while len(self.targets) > self.capacity:
+            self.targets.popitem(last=False)
+
+    def get(self, message_id):
+        target = self.targets.get(message_id)
+        if target is not None:
+            self.targets.move_to_end(message_id)
+        return target
+
+    def remove(self, message_id):
+        self.targets.pop(message_id, None)
+
+    def __len__(self):
+        return len(self.targets)
+
+
+reaction_targets = ReactionTargets()
+
+
 class Pattern(Command):
     def __init__(self, _, **kwargs):
         super().__init__(_, **kwargs)
@@ -56,6 +87,36 @@ class Pattern(Command):
         self.regex = re.compile(regex) if isinstance(regex, str) else regex
 
 
+def make_embed_cache(config, path):
+    return compendium.EmbedCache(
+        config.get("embed_cache_size", 256),
+        config.get("embed_warm_count", 0),
+        path + ".popular",
+    )
+
+
+# Load a dataset from its copy on disk, if there is one, then keep it up to
+# date in the background, passing each version to build.
+def load_compendium(config, url, path, build):
+    data = compendium.Compendium(url, path)
+    cached = data.load()
+    if cached is not None:
+        try:
+            build(cached)
+            utilities.log_message(f"Loaded {path}.")
+        except ValueError:
+            data.invalidate()
+            utilities.log_message(f"Failed to load {path}.")
+
+    data.listeners.append(build)
+    config["client"].loop.create_task(
+        data.revalidate_periodically(
+            config["compendium_interval"], config["client"]
+        )
+    )
+    return data
+
+
 class About(Command):
     def __init__(self, config):
         super().__init__(config, commands=["--about"])
@@ -96,7 +157,14 @@ class Creature(Command):
     def __init__(self, config):
         assert config["dnd_bestiary"]
         super().__init__(config, commands=["--creature"])
-        self.bestiary = bestiary.Bestiary(config["bestiary_url"])
+        self.bestiary = bestiary.Bestiary()
+        self.bestiary.embeds = make_embed_cache(config, config["bestiary_file"])
+        load_compendium(
+            config,
+            config["bestiary_url"],
+            config["bestiary_file"],
+            self.bestiary.build_bestiary,
+        )
 
     async def _handle(self, argument):
         if argument == "":
@@ -209,12 +277,21 @@ class Spell(Command):
     def __init__(self, config):
         assert config["dnd_spells"]
         super().__init__(config, commands=["--spell"])
-        self.sb = spellbook.Spellbook(config["spellbook_url"])
-        utilities.log_message("Successfully downloaded spellbook.")
+        self.sb = spellbook.Spellbook()
+        self.sb.embeds = make_embed_cache(config, config["spellbook_file"])
+        load_compendium(
+            config,
+            config["spellbook_url"],
+            config["spellbook_file"],
+            self.sb.build_spellbook,
+        )
 
     async def _handle(self, argument):
         if argument == "":
-            return "Usage: `--spell <spell name>`."
+            return (
+                "Usage: `--spell <spell name>` or "
+                + "`--spell level:<level> class:<class> school:<school>`."
+            )
         return self.sb.handle_command(argument)
 
 
@@ -288,12 +365,15 @@ class XKCD(Command):
         super().__init__(config, commands=["--xkcd"])
 
         xkcd.init_db()
-        xkcd.start_db_thread(config["xkcd_interval"], config["client"])
+        config["client"].loop.create_task(
+            xkcd.update_periodically(config["xkcd_interval"], config["client"])
+        )
 
     async def _handle(self, argument):
         if argument:
             return await xkcd.get_xkcd(argument)
         return (
             "Use `--xkcd <comic name>` or `--xkcd <number>` to find an"
-            + "xkcd comic, or `--xkcd random` for a random comic."
+            + "xkcd comic, `--xkcd search <words>` to search their titles and "
+            + "alt text, or `--xkcd random` for a random comic."
         )
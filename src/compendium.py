@@ -0,0 +1,199 @@
+import asyncio
+import collections
+import copy
+import json
+import os
+import tempfile
+
+import aiohttp
+import discord
+
+import utilities
+
+
+def write_atomically(path, text):
+    fd, temp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+class Compendium:
+    # A JSON dataset downloaded from url and kept on disk at path. The copy on
+    # disk is used at startup, so commands neither wait for nor depend on the
+    # source, and it is revalidated in the background with conditional
+    # requests. A newer version replaces the file atomically and is passed to
+    # each function in listeners. The validators of the copy on disk are only
+    # sent once it has been loaded, so that a missing or unusable copy is
+    # downloaded again rather than answered with 304.
+
+    TIMEOUT = 60  # seconds
+
+    def __init__(self, url, path):
+        self.url = url
+        self.path = path
+        self.meta_path = path + ".meta"  # validators of the copy on disk
+        self.etag = None
+        self.last_modified = None
+        self.listeners = []
+
+    def load(self):
+        self.invalidate()
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            utilities.log_message(f"No usable copy of {self.url}: {e}")
+            return None
+
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            self.etag = meta.get("etag")
+            self.last_modified = meta.get("last_modified")
+        except (OSError, ValueError):
+            pass
+        return data
+
+    # Forget the validators of the copy on disk, so that the next revalidation
+    # downloads the dataset in full. Used when the copy can't be built.
+    def invalidate(self):
+        self.etag = None
+        self.last_modified = None
+
+    # Returns True if a newer version was downloaded.
+    async def revalidate(self, session):
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        async with session.get(self.url, headers=headers) as resp:
+            if resp.status == 304:
+                return False
+            resp.raise_for_status()
+            text = await resp.text()
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        data = json.loads(text)
+        if not isinstance(data, list):
+            raise ValueError(f"Expected a list from {self.url}.")
+
+        # Listeners raise ValueError if they can't use the data, in which
+        # case it is not saved.
+        for listener in self.listeners:
+            listener(data)
+
+        # The data is written before its validators so that a crash between
+        # the two can only cause an unnecessary download.
+        write_atomically(self.path, text)
+        self.etag, self.last_modified = etag, last_modified
+        write_atomically(
+            self.meta_path,
+            json.dumps({"etag": etag, "last_modified": last_modified}),
+        )
+        utilities.log_message(f"Downloaded new version of {self.url}.")
+        return True
+
+    async def revalidate_periodically(self, interval, client):
+        await client.wait_until_ready()
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=Compendium.TIMEOUT)
+        ) as session:
+            while not client.is_closed():
+                try:
+                    await self.revalidate(session)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    utilities.log_message(f"Failed to fetch {self.url}: {e}")
+                except ValueError as e:
+                    utilities.log_message(f"Bad data from {self.url}: {e}")
+                await asyncio.sleep(interval)
+
+
+class EmbedCache:
+    # Rendered embeds of compendium entries, kept as embed.to_dict() payloads
+    # so that each request gets an Embed of its own. Holds at most capacity
+    # entries, forgetting the least recently used, and is cleared whenever the
+    # data is reloaded. The number of times each entry is requested is saved
+    # to popular_file, so that the warm_count most requested entries can be
+    # rendered ahead of time when the data is next loaded.
+
+    SAVE_EVERY = 50  # requests between saves of the request counts
+    SAVED_ENTRIES = 100  # number of most requested entries to save
+
+    def __init__(self, capacity=256, warm_count=0, popular_file=None):
+        self.capacity = capacity
+        self.warm_count = warm_count
+        self.popular_file = popular_file
+        self.entries = collections.OrderedDict()  # key: embed payload
+        self.requests = collections.Counter()  # key: times requested
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+        if popular_file is not None:
+            try:
+                with open(popular_file, "r") as f:
+                    self.requests.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    # Embeds share their lists with the dicts they are converted to and from,
+    # so payloads are copied on the way in and out.
+    def put(self, key, embed):
+        self.entries[key] = copy.deepcopy(embed.to_dict())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    # Returns the embed for key, calling render to create it if needed.
+    def get(self, key, render):
+        self.count_request(key)
+
+        payload = self.entries.get(key)
+        if payload is None:
+            self.misses += 1
+            embed = render()
+            self.put(key, embed)
+            return embed
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return discord.Embed.from_dict(copy.deepcopy(payload))
+
+    def count_request(self, key):
+        self.requests[key] += 1
+        self.unsaved += 1
+        if (
+            self.popular_file is not None
+            and self.unsaved >= EmbedCache.SAVE_EVERY
+        ):
+            self.unsaved = 0
+            try:
+                write_atomically(
+                    self.popular_file,
+                    json.dumps(
+                        dict(
+                            self.requests.most_common(EmbedCache.SAVED_ENTRIES)
+                        )
+                    ),
+                )
+            except OSError as e:
+                utilities.log_message(f"Failed to save request counts: {e}")
+
+    # Forget every embed, then render the most requested entries. render
+    # returns None for entries which no longer exist.
+    def reset(self, render):
+        self.entries.clear()
+        for key, _ in self.requests.most_common(self.warm_count):
+            embed = render(key)
+            if embed is not None:
+                self.put(key, embed)
@@ -1,7 +1,9 @@
+import asyncio
 import datetime
 import enum
+import itertools
 import os
-import random
+import re
 
 import aiosqlite
 
@@ -15,35 +17,155 @@ class TransTypes(enum.Enum):
 
 
 class Database:
-    VERSION = 1
+    VERSION = 4
+    WAL_PRAGMAS = [
+        "PRAGMA journal_mode = WAL;",
+        "PRAGMA synchronous = NORMAL;",
+        "PRAGMA temp_store = MEMORY;",
+        "PRAGMA busy_timeout = 5000;",
+    ]
 
     def __init__(self):
         self.file = None
         self.startup_commands = [f"PRAGMA user_version = {Database.VERSION};"]
         self.connection = None
 
+        # Writes are grouped into transactions which are committed once
+        # batch_size writes are pending or flush_interval seconds have passed.
+        self.flush_interval = 0.05
+        self.batch_size = 100
+        self.pending_writes = 0
+        self.committing = 0  # commits under way
+        self.flush_task = None
+        # Held while a group of writes is made, so that no commit splits it.
+        # Created in the event loop on first use.
+        self.group_lock = None
+
+        # In WAL mode, reads are served from a pool of read-only connections
+        # so that they don't queue behind writes on the main connection.
+        self.readers = None
+        self.reader_count = 0
+        self.queued_reads = 0
+        self.queued_writes = 0
+
     # Must be called after all desired interfaces are instantiated
     # or startup commands will not be executed.
-    async def make_connection(self, file):
+    async def make_connection(
+        self, file, flush_interval=None, batch_size=None, wal=False, readers=2
+    ):
         self.file = file
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if batch_size is not None:
+            self.batch_size = batch_size
+
         run_migration = os.path.isfile(file)
         self.connection = await aiosqlite.connect(self.file)
+        if wal:
+            for pragma in Database.WAL_PRAGMAS:
+                await self.execute(pragma)
         if run_migration:
             await self.migrate()
         for command in self.startup_commands:
             await self.execute(command, trans_type=TransTypes.COMMIT)
+        await self.save()
+        if wal:
+            await self.open_readers(readers)
         utilities.log_message("Established connection and set up database.")
 
+    async def open_readers(self, count):
+        self.readers = asyncio.Queue()
+        self.reader_count = count
+        for _ in range(count):
+            reader = await aiosqlite.connect(
+                f"file:{self.file}?mode=ro", uri=True
+            )
+            await reader.execute("PRAGMA busy_timeout = 5000;")
+            self.readers.put_nowait(reader)
+
+    def stats(self):
+        return {
+            "readers": self.reader_count,
+            "idle_readers": self.readers.qsize() if self.readers else 0,
+            "queued_reads": self.queued_reads,
+            "queued_writes": self.queued_writes,
+            "pending_writes": self.pending_writes,
+            "committing": self.committing,
+        }
+
+    def get_group_lock(self):
+        if self.group_lock is None:
+            self.group_lock = asyncio.Lock()
+        return self.group_lock
+
     async def save(self):
-        try:
-            await self.connection.commit()
-        except Exception as e:
-            utilities.log_message(f"Database error: {e}")
+        async with self.get_group_lock():
+            self.pending_writes = 0
+            self.committing += 1
+            try:
+                await self.connection.commit()
+            except Exception as e:
+                utilities.log_message(f"Database error: {e}")
+            finally:
+                self.committing -= 1
+
+    # Commit any pending writes now rather than waiting for the next flush.
+    async def sync(self):
+        if self.pending_writes:
+            await self.save()
 
     async def close(self):
+        if self.connection is None:
+            return
+
+        # Let writes already under way finish so that they are committed.
+        while self.queued_writes:
+            await asyncio.sleep(0.01)
+
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.sync()
         await self.connection.close()
+        self.connection = None
+        self.group_lock = None
+
+        if self.readers is not None:
+            for _ in range(self.reader_count):
+                await (await self.readers.get()).close()
+            self.readers = None
+            self.reader_count = 0
+
+    async def flush_after(self, delay):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        await self.sync()
+
+    async def queue_commit(self, writes=1, durable=False):
+        self.pending_writes += writes
+        if durable or self.pending_writes >= self.batch_size:
+            await self.save()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(
+                self.flush_after(self.flush_interval)
+            )
+
+    # Once the reader pool is open, GETALL and GETONE commands are sent to a
+    # read-only connection, so all writes must use TransTypes.COMMIT. Readers
+    # only see committed data, so while writes are waiting to be committed,
+    # or are being committed, reads stay on the main connection, which sees
+    # them, rather than forcing a commit.
+    async def execute(
+        self, command, args=None, trans_type=TransTypes.GETALL, durable=False
+    ):
+        if trans_type != TransTypes.COMMIT:
+            if self.readers is not None and not (
+                self.pending_writes or self.committing
+            ):
+                return await self.read(command, args, trans_type)
+        else:
+            self.queued_writes += 1
 
-    async def execute(self, command, args=None, trans_type=TransTypes.GETALL):
         try:
             if args is not None:
                 cursor = await self.connection.execute(command, args)
@@ -55,10 +177,65 @@ class Database:
             elif trans_type == TransTypes.GETONE:
                 return await cursor.fetchone()
             elif trans_type == TransTypes.COMMIT:
-                await self.save()
+                await self.queue_commit(durable=durable)
+        except Exception as e:
+            utilities.log_message(f"Database error: {e}")
+            utilities.log_message(f"Ocurred on command: {command}")
+        finally:
+            if trans_type == TransTypes.COMMIT:
+                self.queued_writes -= 1
+
+    async def read(self, command, args, trans_type):
+        self.queued_reads += 1
+        try:
+            reader = await self.readers.get()
+        finally:
+            self.queued_reads -= 1
+
+        try:
+            cursor = await reader.execute(command, args or ())
+            if trans_type == TransTypes.GETALL:
+                return await cursor.fetchall()
+            else:
+                return await cursor.fetchone()
+        except Exception as e:
+            utilities.log_message(f"Database error: {e}")
+            utilities.log_message(f"Ocurred on command: {command}")
+        finally:
+            self.readers.put_nowait(reader)
+
+    # Returns False if the command failed.
+    async def executemany(self, command, rows, durable=False):
+        self.queued_writes += 1
+        try:
+            await self.connection.executemany(command, rows)
+            await self.queue_commit(len(rows), durable)
+            return True
+        except Exception as e:
+            utilities.log_message(f"Database error: {e}")
+            utilities.log_message(f"Ocurred on command: {command}")
+            return False
+        finally:
+            self.queued_writes -= 1
+
+    # statements: [(command, rows)], committed together. Returns False if
+    # any of them failed.
+    async def executegroup(self, statements, durable=False):
+        self.queued_writes += 1
+        try:
+            async with self.get_group_lock():
+                writes = 0
+                for command, rows in statements:
+                    await self.connection.executemany(command, rows)
+                    writes += len(rows)
+            await self.queue_commit(writes, durable)
+            return True
         except Exception as e:
             utilities.log_message(f"Database error: {e}")
             utilities.log_message(f"Ocurred on command: {command}")
+            return False
+        finally:
+            self.queued_writes -= 1
 
     async def migrate(self):
         (from_version,) = await self.execute(
@@ -67,10 +244,19 @@ class Database:
 
         if from_version == Database.VERSION:
             utilities.log_message("Database schema up to date!")
-        elif from_version == 0:
+            return
+        elif from_version > Database.VERSION:
             utilities.log_message(
-                f"Database at version 0: updating to {Database.VERSION}"
+                "Don't know how to update database from version "
+                f"{from_version} to version {Database.VERSION}. Exiting."
             )
+            exit(1)
+
+        utilities.log_message(
+            f"Database at version {from_version}: "
+            f"updating to {Database.VERSION}"
+        )
+        if from_version < 1:
             await self.execute("PRAGMA foreign_keys = OFF;")
             await self.execute(
                 "CREATE TABLE _new_campaigns("
@@ -97,14 +283,87 @@ class Database:
                 "ALTER TABLE rolls ADD COLUMN campaign INTEGER REFERENCES "
                 "campaigns(id) ON DELETE SET NULL;"
             )
-            await self.save()
-            utilities.log_message("Database migration successful!")
-        else:
-            utilities.log_message(
-                "Don't know how to update database from version "
-                f"{from_version} to version {Database.VERSION}. Exiting."
+        if from_version < 2:
+            await self.backfill_roll_stats()
+        if from_version < 3:
+            await self.convert_campaign_players()
+        if from_version < 4:
+            await self.index_xkcds()
+        await self.save()
+        utilities.log_message("Database migration successful!")
+
+    async def table_exists(self, table):
+        return bool(
+            await self.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name = ?;",
+                (table,),
             )
-            exit(1)
+        )
+
+    # Version 2 adds roll_stats, a per-die summary of the rolls table.
+    async def backfill_roll_stats(self):
+        await self.execute(Roll_Database.STATS_SCHEMA)
+        if not await self.table_exists("rolls"):
+            return
+
+        totals = {}
+        for string, result, user, server, campaign in await self.execute(
+            "SELECT string, result, user, server, campaign FROM rolls;"
+        ):
+            stats = roll_stats(string, result)
+            if stats is None:
+                continue
+
+            die, count, total, total_sq = stats
+            key = (user, server, campaign or 0, die)
+            if key in totals:
+                totals[key][0] += count
+                totals[key][1] += total
+                totals[key][2] += total_sq
+            else:
+                totals[key] = [count, total, total_sq]
+
+        await self.connection.executemany(
+            "INSERT INTO roll_stats VALUES(?, ?, ?, ?, ?, ?, ?);",
+            [key + tuple(value) for key, value in totals.items()],
+        )
+
+    # Version 3 moves campaign membership from the comma separated players and
+    # nicks columns of campaigns into campaign_players.
+    async def convert_campaign_players(self):
+        if await self.table_exists("rolls"):
+            await self.execute(Roll_Database.ROLLS_INDEX)
+        if not await self.table_exists("campaigns"):
+            return
+        for command in Campaign_Database.PLAYERS_SCHEMA:
+            await self.execute(command)
+
+        rows = []
+        for campaign, players, nicks in await self.execute(
+            "SELECT id, players, nicks FROM campaigns;"
+        ):
+            players = [int(p) for p in players.split(",")] if players else []
+            nicks = (
+                [n.replace('"', "") for n in nicks.split(",")] if nicks else []
+            )
+            for player, nick in itertools.zip_longest(players, nicks):
+                if player is not None:
+                    rows.append((campaign, player, nick or ""))
+
+        await self.connection.executemany(
+            "INSERT OR IGNORE INTO campaign_players VALUES(?, ?, ?);", rows
+        )
+
+    # Version 4 adds xkcds_fts, a full text index of xkcds.
+    async def index_xkcds(self):
+        if not await self.table_exists("xkcds"):
+            return
+        for command in XKCD_Database.SEARCH_SCHEMA:
+            await self.execute(command)
+        await self.execute(
+            "INSERT INTO xkcds_fts(xkcds_fts) VALUES('rebuild');"
+        )
 
 
 database = Database()
@@ -117,26 +376,111 @@ class Interface:
 
 
 class Discord_Database(Interface):
+    # Known (id, name) pairs are kept in memory so that the database is only
+    # written when a user or server is new or renamed.
+
+    TABLES = ["users", "servers"]
+
     def __init__(self):
         super().__init__()
-        for table in ["users", "servers"]:
+        for table in Discord_Database.TABLES:
             database.startup_commands.append(
                 f"CREATE TABLE IF NOT EXISTS {table}("
                 "id INTEGER PRIMARY KEY, name TEXT);",
             )
 
+        # {(table, id): name} of every entry known to be in the database
+        self.known = {}
+        # {(table, id): name} of entries awaiting the next flush
+        self.pending = {}
+        # Lookups which didn't / did require a write
+        self.hits = 0
+        self.misses = 0
+
+    async def load_registry(self):
+        for table in Discord_Database.TABLES:
+            for idno, name in await database.execute(
+                f"SELECT id, name FROM {table};"
+            ):
+                self.known[(table, idno)] = name
+
+    def register(self, table, idno, name):
+        key = (table, idno)
+        if self.known.get(key) == name:
+            self.hits += 1
+            return
+
+        self.misses += 1
+        self.known[key] = name
+        self.pending[key] = name
+
+    def registry_stats(self):
+        return {
+            "known": len(self.known),
+            "pending": len(self.pending),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
     async def insert_user(self, user):
-        command = "REPLACE INTO users VALUES(?, ?);"
-        user_tuple = (user.id, user.name)
-        await database.execute(command, user_tuple, TransTypes.COMMIT)
+        self.register("users", user.id, user.name)
 
     async def insert_server(self, server):
-        command = "REPLACE INTO servers VALUES(?, ?);"
-        server_tuple = (server.id, server.name)
-        await database.execute(command, server_tuple, TransTypes.COMMIT)
+        self.register("servers", server.id, server.name)
+
+    async def flush(self, durable=False):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+        for table in Discord_Database.TABLES:
+            rows = [(i, n) for (t, i), n in pending.items() if t == table]
+            if rows and not await database.executemany(
+                f"REPLACE INTO {table} VALUES(?, ?);", rows, durable
+            ):
+                # Retry on the next flush, unless the entry has since been
+                # registered again under a newer name.
+                for idno, name in rows:
+                    self.pending.setdefault((table, idno), name)
+        utilities.log_message(
+            f"Flushed {len(pending)} user and server updates to database."
+        )
+
+    async def flush_periodically(self, client, interval):
+        try:
+            await client.wait_until_ready()
+            while not client.is_closed():
+                await asyncio.sleep(interval)
+                await self.flush()
+        finally:
+            await self.flush(durable=True)
+
+
+def roll_stats(dice_str, rolls_str):
+    # "4d6", "1,2,3,4" -> (die, count, sum, sum of squares)
+    try:
+        die = int(dice_str.split("d")[1])
+        values = [int(r) for r in rolls_str.split(",")]
+    except (IndexError, ValueError):
+        return None
+
+    return die, len(values), sum(values), sum(v * v for v in values)
 
 
 class Roll_Database(Interface):
+    # Per-die totals of the rolls table, kept up to date by insert_roll.
+    # Rolls made outside of a campaign are stored with campaign 0.
+    ROLLS_INDEX = (
+        "CREATE INDEX IF NOT EXISTS rolls_user_server_campaign "
+        "ON rolls(user, server, campaign);"
+    )
+    STATS_SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS roll_stats("
+        "user INTEGER, server INTEGER, campaign INTEGER NOT NULL DEFAULT 0, "
+        "die INTEGER, count INTEGER, sum INTEGER, sum_sq INTEGER, "
+        "PRIMARY KEY(user, server, campaign, die));"
+    )
+
     def __init__(self):
         super().__init__()
         database.startup_commands.append(
@@ -148,12 +492,15 @@ class Roll_Database(Interface):
             "FOREIGN KEY(campaign) REFERENCES campaigns(id) ON DELETE SET NULL"
             ");"
         )
+        database.startup_commands.append(Roll_Database.ROLLS_INDEX)
+        database.startup_commands.append(Roll_Database.STATS_SCHEMA)
 
     async def get_active_campaign(self, user, server):
         campaign = await database.execute(
-            "SELECT id, name FROM campaigns WHERE "
-            "server = ? AND active = 1 AND players LIKE ?;",
-            (server, f"%{user.id}%"),
+            "SELECT c.id, c.name FROM campaign_players p "
+            "JOIN campaigns c ON c.id = p.campaign "
+            "WHERE p.user = ? AND c.server = ? AND c.active = 1;",
+            (user.id, server),
             TransTypes.GETONE,
         )
 
@@ -165,32 +512,71 @@ class Roll_Database(Interface):
         return campaign_id, campaign_name
 
     async def insert_roll(self, dice_str, rolls_str, user, server):
+        await self.insert_rolls([(dice_str, rolls_str)], user, server)
+
+    # rolls: [(dice_str, rolls_str)], all made by user in one message
+    async def insert_rolls(self, rolls, user, server):
         try:
             campaign_id, _ = await self.get_active_campaign(user, server.id)
         except ValueError:
             campaign_id = None
 
-        data = (dice_str, rolls_str, user.id, server.id, campaign_id)
-        await database.execute(
-            "INSERT INTO rolls VALUES(?, ?, ?, ?, ?);", data, TransTypes.COMMIT
-        )
+        statements = [
+            (
+                "INSERT INTO rolls VALUES(?, ?, ?, ?, ?);",
+                [
+                    (dice_str, rolls_str, user.id, server.id, campaign_id)
+                    for dice_str, rolls_str in rolls
+                ],
+            )
+        ]
+
+        totals = {}
+        for dice_str, rolls_str in rolls:
+            stats = roll_stats(dice_str, rolls_str)
+            if stats is None:
+                continue
+
+            die, *values = stats
+            totals[die] = [
+                t + v for t, v in zip(totals.get(die, [0] * 3), values)
+            ]
+        if totals:
+            statements.append(
+                (
+                    "INSERT INTO roll_stats VALUES(?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user, server, campaign, die) DO UPDATE SET "
+                    "count = count + excluded.count, "
+                    "sum = sum + excluded.sum, "
+                    "sum_sq = sum_sq + excluded.sum_sq;",
+                    [
+                        (user.id, server.id, campaign_id or 0, die, *values)
+                        for die, values in totals.items()
+                    ],
+                )
+            )
 
-    async def get_rolls(self, user, server):
-        id_tuple = (user.id, server.id)
+        # The rolls and their totals are committed together, so that
+        # roll_stats always agrees with rolls.
+        await database.executegroup(statements)
+
+    # Returns [(die, count, sum, sum of squares)]
+    async def get_roll_stats(self, user, server):
         return await database.execute(
-            "SELECT string, result FROM rolls WHERE user = ? AND server = ?;",
-            id_tuple,
+            "SELECT die, SUM(count), SUM(sum), SUM(sum_sq) FROM roll_stats "
+            "WHERE user = ? AND server = ? GROUP BY die;",
+            (user.id, server.id),
             TransTypes.GETALL,
         )
 
-    async def get_campaign_rolls(self, user, server):
+    async def get_campaign_roll_stats(self, user, server):
         campaign_id, campaign_name = await self.get_active_campaign(
             user, server.id
         )
 
         return (
             await database.execute(
-                "SELECT string, result FROM rolls "
+                "SELECT die, count, sum, sum_sq FROM roll_stats "
                 "WHERE user = ? AND server = ? AND campaign = ?;",
                 (user.id, server.id, campaign_id),
                 TransTypes.GETALL,
@@ -199,17 +585,32 @@ class Roll_Database(Interface):
         )
 
     async def reset_rolls(self, user, server=None):
-        if server is not None:
-            sql = "DELETE FROM rolls WHERE user = ? AND server = ?;"
-            tup = (user.id, server.id)
-        else:
-            sql = "DELETE FROM rolls WHERE user = ?;"
-            tup = (user.id,)
+        for table in ["rolls", "roll_stats"]:
+            if server is not None:
+                sql = f"DELETE FROM {table} WHERE user = ? AND server = ?;"
+                tup = (user.id, server.id)
+            else:
+                sql = f"DELETE FROM {table} WHERE user = ?;"
+                tup = (user.id,)
 
-        await database.execute(sql, tup, TransTypes.COMMIT)
+            await database.execute(sql, tup, TransTypes.COMMIT)
 
 
 class Campaign_Database(Interface):
+    # The players and nicks columns of campaigns are unused since version 3;
+    # membership is stored in campaign_players.
+    PLAYERS_SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS campaign_players("
+        "campaign INTEGER, user INTEGER, nick TEXT, "
+        "FOREIGN KEY(campaign) REFERENCES campaigns(id) ON DELETE CASCADE, "
+        "FOREIGN KEY(user) REFERENCES users(id), "
+        "PRIMARY KEY(campaign, user));",
+        "CREATE INDEX IF NOT EXISTS campaign_players_user "
+        "ON campaign_players(user, campaign);",
+        "CREATE INDEX IF NOT EXISTS campaigns_server_active "
+        "ON campaigns(server, active);",
+    ]
+
     def __init__(self):
         super().__init__()
         database.startup_commands.append(
@@ -222,6 +623,7 @@ class Campaign_Database(Interface):
             "FOREIGN KEY(server) REFERENCES servers(id), "
             "UNIQUE(name, server));"
         )
+        database.startup_commands.extend(Campaign_Database.PLAYERS_SCHEMA)
 
     async def set_active(self, campaign):
         await database.execute(
@@ -240,40 +642,86 @@ class Campaign_Database(Interface):
             TransTypes.COMMIT,
         )
 
+    # Campaigns are updated in place rather than replaced so that their id,
+    # referenced by rolls and campaign_players, doesn't change.
     async def add_campaign(self, campaign, active=True):
         await database.execute(
-            "REPLACE INTO campaigns("
-            "name, server, dm, players, nicks, active, "
-            "day, time, notify, channel"
-            ") VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+            "INSERT OR IGNORE INTO campaigns(name, server) VALUES(?, ?);",
+            (campaign.name, campaign.server),
+            TransTypes.COMMIT,
+        )
+        await database.execute(
+            "UPDATE campaigns SET "
+            "dm = ?, active = ?, day = ?, time = ?, notify = ?, channel = ? "
+            "WHERE name = ? AND server = ?;",
             (
-                campaign.name,
-                campaign.server,
                 campaign.dm,
-                ",".join(str(p) for p in campaign.players),
-                ",".join(f'"{n}"' for n in campaign.nicks),
                 int(active),
                 campaign.day,
                 campaign.time,
                 1 if campaign.notify else 0,
                 campaign.channel,
+                campaign.name,
+                campaign.server,
             ),
             TransTypes.COMMIT,
         )
 
+        (campaign_id,) = await database.execute(
+            "SELECT id FROM campaigns WHERE name = ? AND server = ?;",
+            (campaign.name, campaign.server),
+            TransTypes.GETONE,
+        )
+        await database.execute(
+            "DELETE FROM campaign_players WHERE campaign = ?;",
+            (campaign_id,),
+            TransTypes.COMMIT,
+        )
+        await database.executemany(
+            "INSERT OR IGNORE INTO campaign_players VALUES(?, ?, ?);",
+            [
+                (campaign_id, player, nick)
+                for player, nick in zip(campaign.players, campaign.nicks)
+            ],
+        )
+
     async def delete_campaign(self, campaign):
+        await database.execute(
+            "DELETE FROM campaign_players WHERE campaign IN ("
+            "SELECT id FROM campaigns WHERE name = ? AND server = ?);",
+            (campaign.name, campaign.server),
+            TransTypes.COMMIT,
+        )
         await database.execute(
             "DELETE FROM campaigns WHERE name = ? AND server = ?;",
             (campaign.name, campaign.server),
             TransTypes.COMMIT,
         )
 
-    async def get_campaign(self, name, server):
+    async def get_players(self, campaign_id):
         return await database.execute(
-            "SELECT name, dm, players, nicks, day, time, notify, channel "
-            "FROM campaigns WHERE name = ? AND server = ?;",
-            (name, server),
-            TransTypes.GETONE,
+            "SELECT user, nick FROM campaign_players WHERE campaign = ? "
+            "ORDER BY rowid;",
+            (campaign_id,),
+            TransTypes.GETALL,
+        )
+
+    # (id, name, ...) -> (name, ..., [(player, nick)])
+    async def with_players(self, campaign):
+        if campaign is None:
+            return None
+
+        campaign_id, *data = campaign
+        return tuple(data) + (await self.get_players(campaign_id),)
+
+    async def get_campaign(self, name, server):
+        return await self.with_players(
+            await database.execute(
+                "SELECT id, name, dm, day, time, notify, channel "
+                "FROM campaigns WHERE name = ? AND server = ?;",
+                (name, server),
+                TransTypes.GETONE,
+            )
         )
 
     async def suggest_campaign(self, name, server):
@@ -284,11 +732,13 @@ class Campaign_Database(Interface):
         )
 
     async def get_active_campaign(self, server):
-        return await database.execute(
-            "SELECT name, dm, players, nicks, day, time, notify, channel "
-            "FROM campaigns WHERE server = ? AND active = 1;",
-            (server,),
-            TransTypes.GETONE,
+        return await self.with_players(
+            await database.execute(
+                "SELECT id, name, dm, day, time, notify, channel "
+                "FROM campaigns WHERE server = ? AND active = 1;",
+                (server,),
+                TransTypes.GETONE,
+            )
         )
 
     async def get_campaign_names(self, server):
@@ -298,43 +748,71 @@ class Campaign_Database(Interface):
             TransTypes.GETALL,
         )
 
+    # Returns [(name, channel, [player])]
     async def get_reminders(self, period, delta):
         now = datetime.datetime.now()
         notif_time = now.hour * 3600 + now.minute * 60 + now.second + delta
-        return await database.execute(
-            "SELECT name, channel, players FROM campaigns "
+        reminders = []
+        for campaign_id, name, channel in await database.execute(
+            "SELECT id, name, channel FROM campaigns "
             "WHERE notify = 1 AND day = ? AND time - ? < ? AND time - ? > 0;",
             (now.weekday(), notif_time, period, notif_time),
             TransTypes.GETALL,
-        )
+        ):
+            players = await self.get_players(campaign_id)
+            reminders.append((name, channel, [p for p, _ in players]))
+        return reminders
 
 
 class XKCD_Database(Interface):
+    # Full text index of titles and alt text, kept up to date by triggers.
+    SEARCH_SCHEMA = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS xkcds_fts USING fts5("
+        "name, alt, content='xkcds', content_rowid='id', "
+        "tokenize='porter unicode61');",
+        "CREATE TRIGGER IF NOT EXISTS xkcds_fts_insert AFTER INSERT ON xkcds "
+        "BEGIN INSERT INTO xkcds_fts(rowid, name, alt) "
+        "VALUES(new.id, new.name, new.alt); END;",
+        "CREATE TRIGGER IF NOT EXISTS xkcds_fts_delete AFTER DELETE ON xkcds "
+        "BEGIN INSERT INTO xkcds_fts(xkcds_fts, rowid, name, alt) "
+        "VALUES('delete', old.id, old.name, old.alt); END;",
+        "CREATE TRIGGER IF NOT EXISTS xkcds_fts_update AFTER UPDATE ON xkcds "
+        "BEGIN INSERT INTO xkcds_fts(xkcds_fts, rowid, name, alt) "
+        "VALUES('delete', old.id, old.name, old.alt); "
+        "INSERT INTO xkcds_fts(rowid, name, alt) "
+        "VALUES(new.id, new.name, new.alt); END;",
+    ]
+    SEARCH_LIMIT = 5
+
     def __init__(self):
         super().__init__()
         database.startup_commands.append(
             "CREATE TABLE IF NOT EXISTS xkcds("
             "id INTEGER PRIMARY KEY, name TEXT, uri TEXT, alt TEXT);",
         )
-
-    async def xkcd_count(self):
-        data = await database.execute(
-            "SELECT COUNT(*) FROM xkcds;", trans_type=TransTypes.GETONE
+        database.startup_commands.extend(XKCD_Database.SEARCH_SCHEMA)
+
+    # Returns False if the comics couldn't be stored.
+    async def insert_xkcds(self, xkcds):
+        return await database.executemany(
+            # Not OR REPLACE, as its implicit delete wouldn't fire the
+            # trigger keeping xkcds_fts in sync.
+            "INSERT OR IGNORE INTO xkcds VALUES(?, ?, ?, ?);",
+            [(x.idno, x.name, x.uri, x.alt) for x in xkcds],
+            durable=True,
         )
-        return data[0]
 
-    async def insert_xkcd(self, xkcd):
-        await database.execute(
-            "INSERT INTO xkcds VALUES(?, ?, ?, ?);",
-            (xkcd.idno, xkcd.name, xkcd.uri, xkcd.alt),
-            TransTypes.COMMIT,
+    async def get_max_id(self):
+        data = await database.execute(
+            "SELECT COALESCE(max(id), 0) FROM xkcds;",
+            trans_type=TransTypes.GETONE,
         )
+        return data[0] if data else None
 
-    async def get_xkcd_list(self):
-        data = await database.execute(
-            "SELECT name FROM xkcds;", trans_type=TransTypes.GETALL
+    async def get_xkcd_titles(self):
+        return await database.execute(
+            "SELECT id, name FROM xkcds;", trans_type=TransTypes.GETALL
         )
-        return [item[0] for item in data]
 
     async def get_xkcd(self, name):
         return self.interpret_xkcd(
@@ -345,24 +823,21 @@ class XKCD_Database(Interface):
             )
         )
 
-    async def get_random_xkcd(self):
-        newest = (
-            await database.execute(
-                "SELECT max(id) FROM xkcds;", trans_type=TransTypes.GETONE
-            )
-        )[0]
-        comic = random.randint(newest - await self.xkcd_count(), newest)
-        try:
-            return self.interpret_xkcd(
-                await database.execute(
-                    "SELECT id, name, uri, alt FROM xkcds WHERE id = ?;",
-                    (str(comic),),
-                    TransTypes.GETONE,
-                )
-            )
-        except TypeError:
-            utilities.log_message(f"Missing xkcd #{comic}.")
-            return await self.get_random_xkcd()
+    # Comics matching any of the words, best first, ranked by BM25 with
+    # matches in titles counting for more than those in alt text.
+    async def search_xkcds(self, words, limit=SEARCH_LIMIT):
+        terms = re.findall(r"\w+", words)
+        if not terms:
+            return []
+
+        data = await database.execute(
+            "SELECT xkcds.id, xkcds.name, xkcds.uri, xkcds.alt "
+            "FROM xkcds_fts JOIN xkcds ON xkcds.id = xkcds_fts.rowid "
+            "WHERE xkcds_fts MATCH ? "
+            "ORDER BY bm25(xkcds_fts, 10.0, 1.0) LIMIT ?;",
+            (" OR ".join(f'"{term}"' for term in terms), limit),
+        )
+        return [self.interpret_xkcd(row) for row in data]
 
     async def get_newest_xkcd(self):
         return self.interpret_xkcd(
@@ -49,11 +49,15 @@ class RollCommand(commands.Command):
             return
 
         if server and user:
-            for r in rolls:
-                for dice_str, values in r.roll_info():
-                    await self.db.insert_roll(
-                        dice_str, ",".join(map(str, values)), user, server
-                    )
+            await self.db.insert_rolls(
+                [
+                    (dice_str, ",".join(map(str, values)))
+                    for r in rolls
+                    for dice_str, values in r.roll_info()
+                ],
+                user,
+                server,
+            )
 
         e = build_embed(rolls, mention, string)
         if command == "--roll":
@@ -84,11 +88,11 @@ class RollCommand(commands.Command):
 
     async def handle_stats(self, string, user, server, mention, channel):
         if string == "stats":
-            e = stats_embed(await self.db.get_rolls(user, server), mention)
+            e = stats_embed(await self.db.get_roll_stats(user, server), mention)
             await channel.send(embed=e)
         elif string == "campaign stats":
             try:
-                rolls, campaign_name = await self.db.get_campaign_rolls(
+                stats, campaign_name = await self.db.get_campaign_roll_stats(
                     user, server
                 )
             except ValueError:
@@ -98,7 +102,7 @@ class RollCommand(commands.Command):
                 )
                 return
 
-            e = stats_embed(rolls, f"{mention} in {campaign_name}")
+            e = stats_embed(stats, f"{mention} in {campaign_name}")
             await channel.send(embed=e)
         elif string == "reset stats":
             self.delete_message = False
@@ -149,40 +153,26 @@ def build_embed(rolls, mention, string):
 
 
 def stats_embed(data, mention):
-    results = {}
-    for string, result in data:
-        _, die = string.split("d")
-        die = int(die)
-        rolls = [int(r) for r in result.split(",")]
-        if die in results:
-            results[die].extend(rolls)
-        else:
-            results[die] = rolls
+    # data: [(die, count, sum, sum of squares)]
+    results = {die: (count, total) for die, count, total, _ in data}
 
     embed = discord.Embed(description=f"Roll stats for {mention}")
     for die in [4, 6, 8, 10, 12, 20]:
-        rolls = results.get(die, [])
+        count, total = results.pop(die, (0, 0))
         die_avg = (die + 1) / 2
-        avg = round(sum(rolls) / len(rolls), 1) if rolls else 0
-        delta = round(avg - die_avg, 1) if rolls else 0
+        avg = round(total / count, 1) if count else 0
+        delta = round(avg - die_avg, 1) if count else 0
         delta_string = (
             f"+{delta}" if delta > 0 else str(delta) if delta < 0 else "avg"
         )
 
         embed.add_field(
-            name=f"d{die} ({len(rolls)} rolled)",
+            name=f"d{die} ({count} rolled)",
             value=f"```{avg} ({delta_string})```",
             inline=True,
         )
 
-        try:
-            del results[die]
-        except KeyError:
-            pass
-
-    other = 0
-    for r in results:
-        other += len(results[r])
+    other = sum(count for count, _ in results.values())
     embed.set_footer(text=f"{other} other die rolled.")
 
     return embed
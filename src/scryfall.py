@@ -1,9 +1,15 @@
+import asyncio
+import collections
+import json
 import random  # used to return a random sample of suggestions
 import re
+import time
+import urllib.parse
 
-import requests  # Grab card data from scryfall
+import aiohttp  # Grab card data from scryfall
 import discord
 
+import cardindex
 import commands
 import utilities
 
@@ -19,6 +25,17 @@ class Card:
         "C": discord.Colour.from_rgb(209, 213, 214),
     }
 
+    __slots__ = [
+        "name",
+        "uri",
+        "art_uri",
+        "price",
+        "colour_id",
+        "ed",
+        "embed_style",
+        "description",
+    ]
+
     def __init__(
         self, name, uri, art_uri, price, colour_id, ed, embed_style="thumbnail"
     ):
@@ -73,6 +90,8 @@ class Card:
 
 
 class BackFace(Card):
+    __slots__ = ["front_face"]
+
     def __init__(self, name, uri, art_uri, front_face):
         super().__init__(
             name,
@@ -84,11 +103,12 @@ class BackFace(Card):
             front_face.embed_style,
         )
         self.front_face = front_face
-        self.other_face = front_face
         self.description = ""
 
 
 class DoubleFacedCard(Card):
+    __slots__ = ["back_face"]
+
     def __init__(
         self,
         names,
@@ -103,7 +123,6 @@ class DoubleFacedCard(Card):
             names[0], uris[0], art_uris[0], price, colour_id, ed, embed_style
         )
         self.back_face = BackFace(names[1], uris[1], art_uris[1], self)
-        self.other_face = self.back_face
 
     def __repr__(self):
         return (
@@ -129,6 +148,13 @@ def get_price_string(data):
     return f"${price}"
 
 
+def get_price(data):
+    for key in ["usd", "usd_foil"]:
+        if data["prices"][key] is not None:
+            return float(data["prices"][key])
+    return None
+
+
 def card_from_scryfall_response(data, art_crop=False):
     price = get_price_string(data)
     colour_id = data["color_identity"]
@@ -151,36 +177,96 @@ def card_from_scryfall_response(data, art_crop=False):
         return Card(name, uri, art_uri, price, colour_id, ed)
 
 
+class PageBudget:
+    # Limits the number of search result pages after the first which are kept
+    # in memory for each channel, forgetting the least recently used, and the
+    # number of channels tracked, forgetting every page of the channel least
+    # recently used.
+
+    LIMIT = 4
+    MAX_CHANNELS = 100
+
+    def __init__(self, limit=LIMIT, max_channels=MAX_CHANNELS):
+        self.limit = limit
+        self.max_channels = max_channels
+        # channel id: {(card list, page): None}, least recently used first
+        self.channels = collections.OrderedDict()
+
+    def add(self, channel_id, cards, page):
+        pages = self.channels.setdefault(channel_id, collections.OrderedDict())
+        self.channels.move_to_end(channel_id)
+        pages[(cards, page)] = None
+        pages.move_to_end((cards, page))
+
+        while len(pages) > self.limit:
+            (evicted_cards, evicted), _ = pages.popitem(last=False)
+            evicted_cards.pages[evicted] = None
+
+        while len(self.channels) > self.max_channels:
+            _, evicted_pages = self.channels.popitem(last=False)
+            for evicted_cards, evicted in evicted_pages:
+                evicted_cards.pages[evicted] = None
+
+    def touch(self, channel_id, cards, page):
+        pages = self.channels.get(channel_id)
+        if pages is not None and (cards, page) in pages:
+            self.channels.move_to_end(channel_id)
+            pages.move_to_end((cards, page))
+
+
+page_budget = PageBudget()
+
+
 class CardList:
-    def __init__(self, cards, message, total_cards=None, in_order=False):
-        self.cards = cards
+    # Displays the results of a search VIEW_SIZE cards at a time. Holds the
+    # raw Scryfall data of each page of results, only creating Card objects
+    # for those which are selected. Later pages are fetched in the background
+    # as the user nears the end of those already loaded.
+
+    VIEW_SIZE = 5
+    PREFETCH_VIEWS = 3
+
+    def __init__(self, data, message, total_cards=None, next_page=None):
+        self.pages = [data]  # lists of card data, None if evicted
+        self.page_urls = [None, next_page] if next_page else [None]
+        self.page_size = max(len(data), 1)
+        self.loading = {}  # page: future
+        self.cards = {}  # index in results: Card
         self.message = message
-        self.total_cards = (
-            total_cards if total_cards is not None else len(self.cards)
-        )
-        self._results = None
-        self.in_order = in_order
+        self.total_cards = total_cards if total_cards is not None else len(data)
+        self.view = 0
+        self.channel_id = None
 
+    def get_data(self, i):
+        page, offset = divmod(i, self.page_size)
+        return self.pages[page][offset]
+
+    # Indices of the cards to display
     @property
     def results(self):
-        if self._results is None:
-            if len(self.cards) > 5:
-                if self.in_order:
-                    return self.cards[:5]
-                else:
-                    results = self.cards[:]
-                    random.shuffle(results)
-                    self._results = sorted(results[:5], key=lambda c: c.name)
-            else:
-                self._results = self.cards
-        return self._results
+        start = self.view * CardList.VIEW_SIZE
+        return list(
+            range(start, min(start + CardList.VIEW_SIZE, self.total_cards))
+        )
+
+    def view_count(self):
+        return -(-self.total_cards // CardList.VIEW_SIZE)
+
+    def get_card(self, i):
+        if i not in self.cards:
+            self.cards[i] = card_from_scryfall_response(self.get_data(i))
+        return self.cards[i]
 
     def get_embed(self):
+        results = self.results
         e = discord.Embed(
             title=self.message,
-            description="\n".join([c.name for c in self.results]),
+            description="\n".join([self.get_data(i)["name"] for i in results]),
+        )
+        e.set_footer(
+            text=f"{results[0] + 1}-{results[-1] + 1} of "
+            f"{self.total_cards} results."
         )
-        e.set_footer(text=f"{len(self.results)} of {self.total_cards} results.")
 
         return e
 
@@ -191,16 +277,323 @@ class CardList:
                 f"only {len(self.results)} entries."
             )
         else:
-            return self.results[index]
+            return self.get_card(self.results[index])
+
+    async def show(self, view):
+        view = max(0, min(view, self.view_count() - 1))
+        start = view * CardList.VIEW_SIZE
+        end = min(start + CardList.VIEW_SIZE, self.total_cards) - 1
+        for page in range(start // self.page_size, end // self.page_size + 1):
+            await self.load_page(page)
+
+        self.view = view
+        self.prefetch()
+
+    async def load_page(self, page):
+        if page < len(self.pages) and self.pages[page] is not None:
+            page_budget.touch(self.channel_id, self, page)
+            return
+        if page >= len(self.page_urls):
+            await self.load_page(page - 1)
+            if page >= len(self.page_urls):
+                raise ValueError(f"Search results have no page {page}.")
+
+        if page not in self.loading:
+            self.loading[page] = asyncio.ensure_future(self.fetch_page(page))
+        await self.loading[page]
+
+    async def fetch_page(self, page):
+        try:
+            # Not cached, as the page is held here until the budget evicts it.
+            data = await client.get_json(self.page_urls[page], cache=False)
+            if data.get("object") != "list":
+                raise ValueError(f"Failed to fetch page {page} of results.")
+
+            while len(self.pages) <= page:
+                self.pages.append(None)
+            self.pages[page] = data["data"]
+            if data.get("has_more") and len(self.page_urls) == page + 1:
+                self.page_urls.append(data["next_page"])
+            page_budget.add(self.channel_id, self, page)
+        finally:
+            del self.loading[page]
+
+    def prefetch(self):
+        page = len(self.pages)
+        end = (self.view + CardList.PREFETCH_VIEWS) * CardList.VIEW_SIZE
+        if (
+            page < len(self.page_urls)
+            and page not in self.loading
+            and end >= page * self.page_size
+        ):
+            asyncio.ensure_future(self.prefetch_page(page))
+
+    async def prefetch_page(self, page):
+        try:
+            await self.load_page(page)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            utilities.log_message(f"Failed to prefetch search results: {e}")
 
     @staticmethod
-    def from_scryfall_response(data, message, in_order=False):
+    def from_scryfall_response(data, message):
         return CardList(
-            [card_from_scryfall_response(c) for c in data.get("data")],
+            data.get("data"),
             message,
             data.get("total_cards"),
-            in_order,
+            data.get("next_page") if data.get("has_more") else None,
+        )
+
+
+class ResponseCache:
+    # Scryfall responses by normalised request URL, evicted least recently
+    # used first once their total size exceeds max_size bytes.
+
+    CARD_TTL = 12 * 60 * 60  # seconds; prices are updated daily
+    LIST_TTL = 60 * 60
+    NOT_FOUND_TTL = 10 * 60
+
+    MAX_SIZE = 16 * 1024 * 1024  # bytes
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()  # key: (expiry, size, data)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(url):
+        return " ".join(urllib.parse.unquote(url).lower().split())
+
+    @staticmethod
+    def ttl(data):
+        if data.get("status") == 404:
+            return ResponseCache.NOT_FOUND_TTL
+        elif data.get("object") == "card":
+            return ResponseCache.CARD_TTL
+        elif data.get("object") == "list":
+            return ResponseCache.LIST_TTL
+        return None
+
+    def get(self, url):
+        key = ResponseCache.key(url)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.remove(key)
+
+        self.misses += 1
+        return None
+
+    def put(self, url, data, size):
+        ttl = ResponseCache.ttl(data)
+        if ttl is None or size > self.max_size:
+            return
+
+        key = ResponseCache.key(url)
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (time.monotonic() + ttl, size, data)
+        self.size += size
+
+        while self.size > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def flush(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+        }
+
+
+class RateLimited(aiohttp.ClientError):
+    pass
+
+
+class RateLimiter:
+    # Token bucket allowing rate requests a second on average, in bursts of
+    # up to burst requests. Callers wait in turn for a token; once
+    # max_waiting callers are waiting, further requests are refused.
+
+    RATE = 10
+    MAX_WAITING = 100
+
+    def __init__(self, rate=RATE, burst=10, max_waiting=MAX_WAITING):
+        self.rate = rate
+        self.burst = burst
+        self.max_waiting = max_waiting
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = None  # created in the event loop on first use
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
         )
+        self.updated = now
+
+    async def acquire(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise RateLimited(
+                f"{self.waiting} requests already waiting for Scryfall."
+            )
+
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        start = time.monotonic()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            async with self.lock:
+                self.refill()
+                if self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    self.refill()
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self):
+        return {
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "mean_wait": (
+                self.total_wait / self.acquired if self.acquired else 0
+            ),
+            "max_wait": self.max_wait,
+        }
+
+
+class ScryfallClient:
+    # One keep-alive session is shared by all requests to Scryfall. It is
+    # created lazily as aiohttp sessions must be made inside the event loop.
+
+    TIMEOUT = 10  # seconds
+    HEADERS = {"Accept": "application/json", "User-Agent": "owen-bot"}
+
+    def __init__(
+        self,
+        cache_size=ResponseCache.MAX_SIZE,
+        rate=RateLimiter.RATE,
+        max_waiting=RateLimiter.MAX_WAITING,
+    ):
+        self.session = None
+        self.cache = ResponseCache(cache_size)
+        self.limiter = RateLimiter(rate, max_waiting=max_waiting)
+        self.in_flight = {}  # cache key: future of response
+        self.coalesced = 0
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, keepalive_timeout=60),
+                headers=ScryfallClient.HEADERS,
+                timeout=aiohttp.ClientTimeout(total=ScryfallClient.TIMEOUT),
+            )
+        return self.session
+
+    # Identical requests made while one is already in flight share its
+    # response. Uncached requests, such as those for random cards, are
+    # always made separately.
+    async def get_json(self, url, cache=True):
+        if not cache:
+            return await self.fetch_json(url)
+
+        data = self.cache.get(url)
+        if data is not None:
+            return data
+
+        key = ResponseCache.key(url)
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch_json(url, cache=True))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.finish_flight(key, f))
+        else:
+            self.coalesced += 1
+
+        # Shielded so that one caller giving up doesn't cancel the others.
+        return await asyncio.shield(future)
+
+    def finish_flight(self, key, future):
+        self.in_flight.pop(key, None)
+        if not future.cancelled():
+            future.exception()  # retrieved here in case all callers gave up
+
+    async def fetch_json(self, url, cache=False):
+        await self.limiter.acquire()
+        async with self.get_session().get(url) as resp:
+            text = await resp.text()
+        data = json.loads(text)
+
+        if cache:
+            self.cache.put(url, data, len(text))
+        return data
+
+    async def post_json(self, url, data):
+        await self.limiter.acquire()
+        async with self.get_session().post(url, json=data) as resp:
+            text = await resp.text()
+        return json.loads(text)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.limiter.lock = None
+
+
+client = ScryfallClient()
+index = cardindex.CardIndex()
+
+
+# Replace the shared client and page budget with ones using the limits in
+# config. Must be called before any requests are made.
+def configure(config):
+    global client, page_budget
+    client = ScryfallClient(
+        config.get("scryfall_cache_size", ResponseCache.MAX_SIZE),
+        config.get("scryfall_rate_limit", RateLimiter.RATE),
+        config.get("scryfall_queue_limit", RateLimiter.MAX_WAITING),
+    )
+    page_budget = PageBudget(
+        config.get("scryfall_prefetch_pages", PageBudget.LIMIT),
+        config.get("scryfall_page_channels", PageBudget.MAX_CHANNELS),
+    )
 
 
 class ScryfallRequest:
@@ -223,7 +616,6 @@ class ScryfallRequest:
     ERROR_MESSAGE = "Something went wrong and I failed to {}"
     FAILURE_MESSAGE = "I'm afraid I couldn't find {}"
     SUGGEST_MESSAGE = FAILURE_MESSAGE + ". Perhaps you meant one of these?"
-    SCRYFALL_ORDER_KEYWORD = "order:"
 
     def __init__(self, query, ed, is_search=False, embed_style="thumbnail"):
         self.query = query
@@ -242,19 +634,32 @@ class ScryfallRequest:
 
     def format_query(self, query_type, *args):
         return ScryfallRequest.QUERIES[query_type].format(
-            *map(requests.utils.quote, args)
+            *map(urllib.parse.quote, args)
         )
 
-    def perform_request(self, query, failure_message, suggest=None):
+    async def perform_request(
+        self, query, failure_message, suggest=None, cache=True
+    ):
+        try:
+            return await self._perform_request(
+                query, failure_message, suggest, cache
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            utilities.log_message(f"Scryfall request for {query} failed: {e}")
+            self.result = None
+            return self.result
+
+    async def _perform_request(self, query, failure_message, suggest, cache):
         self.result = failure_message
 
-        resp = requests.get(ScryfallRequest.BASE_URL + query).json()
+        resp = await client.get_json(ScryfallRequest.BASE_URL + query, cache)
         if resp.get("status") == 404:
             if suggest is not None:
-                resp = requests.get(
+                resp = await client.get_json(
                     ScryfallRequest.BASE_URL
-                    + self.format_query("search", self.query)
-                ).json()
+                    + self.format_query("search", self.query),
+                    cache,
+                )
 
                 if resp.get("status") == 404:
                     return self.result
@@ -278,70 +683,77 @@ class ScryfallRequest:
                 self.result.set_embed_style(self.embed_style)
             else:
                 message = suggest if suggest is not None else ""
-                self.result = CardList.from_scryfall_response(
-                    resp,
-                    message,
-                    in_order=ScryfallRequest.SCRYFALL_ORDER_KEYWORD in query,
-                )
+                self.result = CardList.from_scryfall_response(resp, message)
 
         return self.result
 
-    def get_random_card(self):
+    async def get_random_card(self):
         if self.ed:
-            return self.perform_request(
+            return await self.perform_request(
                 self.format_query("random_ed", self.ed),
                 f'I couldn\'t find edition "{self.ed}".',
+                cache=False,
             )
-        return self.perform_request(
+        return await self.perform_request(
             ScryfallRequest.QUERIES["random"],
             ScryfallRequest.ERROR_MESSAGE.format("find a random card."),
+            cache=False,
         )
 
-    def get_best_card(self):
-        return self.perform_request(
+    async def get_best_card(self):
+        return await self.perform_request(
             self.format_query(
                 "fuzzy", random.choice(ScryfallRequest.BEST_CARDS)
             ),
             ScryfallRequest.ERROR_MESSAGE.format("find the best card."),
+            cache=False,
         )
 
-    def get_card(self):
+    async def get_card(self):
+        data = index.lookup(self.query, self.ed)
+        if data is not None:
+            self.result = card_from_scryfall_response(
+                data, self.embed_style == "art"
+            )
+            self.result.set_embed_style(self.embed_style)
+            return self.result
+
         if self.ed:
             query_string = f'"{self.query}" in "{self.ed}"'
-            return self.perform_request(
+            return await self.perform_request(
                 self.format_query("name_ed", self.ed, self.query),
                 ScryfallRequest.FAILURE_MESSAGE.format(query_string),
                 ScryfallRequest.SUGGEST_MESSAGE.format(query_string),
             )
-        return self.perform_request(
+        return await self.perform_request(
             self.format_query("fuzzy", self.query),
             ScryfallRequest.FAILURE_MESSAGE.format(self.query),
             ScryfallRequest.SUGGEST_MESSAGE.format(self.query),
         )
 
-    def get_search_results(self):
-        return self.perform_request(
+    async def get_search_results(self):
+        return await self.perform_request(
             self.format_query("search", self.query),
             ScryfallRequest.FAILURE_MESSAGE.format(
                 "any cards matching this search."
             ),
         )
 
-    def resolve(self):
+    async def resolve(self):
         if self.is_search:
-            self.get_search_results()
+            await self.get_search_results()
         elif self.query.lower() == "random":
-            self.get_random_card()
+            await self.get_random_card()
         elif self.query.lower() in ["best card", "the best card"]:
-            self.get_best_card()
+            await self.get_best_card()
         else:
-            self.get_card()
+            await self.get_card()
 
         return self.result
 
-    def get_result(self):
+    async def get_result(self):
         if self.result is None:
-            self.resolve()
+            await self.resolve()
 
         if self.result is None:
             utilities.log_message(
@@ -398,6 +810,188 @@ def get_queries(message):
     return queries
 
 
+class ScryfallAdmin(commands.Command):
+    def __init__(self, config):
+        assert config["scryfall"]
+        super().__init__(config, commands=["--scryfall"])
+        self.admins = config.get("admins", [])
+
+    async def handle(self, message):
+        if message.author.id not in self.admins:
+            return "Only bot admins can use this command."
+
+        argument = self.remove_command_string(message.content).lower()
+        if argument == "stats":
+            stats = client.cache.stats()
+            limits = client.limiter.stats()
+            return (
+                f"Scryfall cache: {stats['entries']} responses, "
+                f"{stats['size'] // 1024}KiB, "
+                f"{stats['hit_rate']:.0%} hit rate "
+                f"({stats['hits']} hits, {stats['misses']} misses), "
+                f"{stats['evictions']} evicted.\n"
+                f"Rate limiter: {limits['waiting']} waiting "
+                f"(peak {limits['peak_waiting']}), "
+                f"{limits['mean_wait']:.2f}s mean wait "
+                f"({limits['max_wait']:.2f}s max), "
+                f"{limits['rejected']} rejected, "
+                f"{client.coalesced} coalesced."
+            )
+        elif argument == "flush":
+            client.cache.flush()
+            utilities.log_message("Flushed scryfall cache.")
+            return "Flushed the Scryfall cache."
+        return "Usage: `--scryfall stats` or `--scryfall flush`."
+
+
+class Decklist:
+    # A pasted decklist, resolved with one request to Scryfall's collection
+    # endpoint for each BATCH_SIZE distinct cards rather than one per card.
+
+    BATCH_SIZE = 75  # the most identifiers Scryfall accepts in one request
+    SHOWN_CARDS = 10  # number of most expensive cards to list
+    # "4x Name (SET) 123 *F*", where everything but the name is optional and
+    # the set may be in square brackets.
+    LINE_REGEX = re.compile(
+        r"^(?:(?P<count>\d+)x?\s+)?(?P<name>[^()\[\]*]+?)"
+        r"(?:\s+[(\[](?P<ed>\w+)[)\]](?:\s+[^\s*]+)?)?"
+        r"(?:\s+\*\w+\*)*$"
+    )
+    SECTIONS = ["deck", "sideboard", "commander", "companion", "maybeboard"]
+
+    def __init__(self, text):
+        self.entries = collections.OrderedDict()  # (name, ed): count
+        self.cards = []  # (count, name, price per copy)
+        self.missing = []  # names of cards Scryfall couldn't find
+
+        for line in text.splitlines():
+            line = line.strip()
+            if (
+                not line
+                or line.startswith(("#", "//"))
+                or line.rstrip(":").lower() in Decklist.SECTIONS
+            ):
+                continue
+
+            match = Decklist.LINE_REGEX.match(line)
+            if match is None:
+                self.missing.append(line)
+                continue
+
+            key = (match.group("name"), match.group("ed"))
+            count = int(match.group("count") or 1)
+            self.entries[key] = self.entries.get(key, 0) + count
+
+    @staticmethod
+    def identifier(name, ed):
+        if ed is None:
+            return {"name": name}
+        return {"name": name, "set": ed.lower()}
+
+    async def resolve(self):
+        keys = list(self.entries)
+        batches = [
+            keys[i : i + Decklist.BATCH_SIZE]
+            for i in range(0, len(keys), Decklist.BATCH_SIZE)
+        ]
+        responses = await asyncio.gather(
+            *[
+                client.post_json(
+                    ScryfallRequest.BASE_URL + "collection",
+                    {"identifiers": [Decklist.identifier(*k) for k in batch]},
+                )
+                for batch in batches
+            ]
+        )
+
+        for batch, resp in zip(batches, responses):
+            if resp.get("object") != "list":
+                raise ValueError(f"Collection request failed: {resp}")
+
+            # Scryfall doesn't promise to return cards in the order they were
+            # requested, so they are matched by name, and set if one was
+            # given. Either face of a double faced card matches it.
+            by_name = {}
+            for card in resp["data"]:
+                names = [card["name"]]
+                names.extend(f["name"] for f in card.get("card_faces", []))
+                for name in names:
+                    name = cardindex.normalise(name)
+                    by_name.setdefault((name, None), card)
+                    by_name.setdefault((name, card["set"].lower()), card)
+
+            for key in batch:
+                name, ed = key
+                card = by_name.get(
+                    (cardindex.normalise(name), ed.lower() if ed else None)
+                )
+                if card is None:
+                    self.missing.append(name)
+                else:
+                    self.cards.append(
+                        (self.entries[key], card["name"], get_price(card))
+                    )
+
+    def total_price(self):
+        return sum(
+            count * price for count, _, price in self.cards if price is not None
+        )
+
+    def get_embed(self):
+        count = sum(count for count, _, _ in self.cards)
+        priced = sorted(
+            [c for c in self.cards if c[2] is not None],
+            key=lambda c: c[0] * c[2],
+            reverse=True,
+        )
+
+        lines = [f"{count} cards, ${self.total_price():.2f} total.", ""]
+        for n, name, price in priced[: Decklist.SHOWN_CARDS]:
+            lines.append(f"{n}x {name} (${n * price:.2f})")
+
+        e = discord.Embed(title="Decklist", description="\n".join(lines))
+        if self.missing:
+            missing = ", ".join(self.missing)
+            if len(missing) > 1024:  # longest value Discord allows in a field
+                missing = missing[:1021] + "..."
+            e.add_field(name="Not found", value=missing)
+        unpriced = len(self.cards) - len(priced)
+        if unpriced:
+            e.set_footer(text=f"{unpriced} cards have no price.")
+
+        return e
+
+
+class ScryfallDeck(commands.Command):
+    def __init__(self, config):
+        assert config["scryfall"]
+        super().__init__(config, commands=["--deck"])
+
+    async def handle(self, message):
+        deck = Decklist(self.remove_command_string(message.content))
+        if not deck.entries:
+            return "Usage: `--deck` followed by a decklist, one card a line."
+
+        try:
+            await deck.resolve()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            utilities.log_message(f"Failed to resolve decklist: {e}")
+            return ScryfallRequest.ERROR_MESSAGE.format("look up that deck.")
+        return deck.get_embed()
+
+
+class SentCard:
+    # A message sent by ScryfallHandler, along with the message showing the
+    # other face of the card if it is double faced.
+
+    __slots__ = ["message", "content", "other"]
+
+    def __init__(self, message, content, other=None):
+        self.message = message
+        self.content = content
+        self.other = other
+
+
 class ScryfallHandler(commands.Pattern):
     # pylint: disable=abstract-method
 
@@ -424,7 +1018,11 @@ class ScryfallHandler(commands.Pattern):
         "heavy_multiplication_x",
         "cross_mark_button",
     ]
-    MESSAGE_CACHE_SIZE = 20  # number of messages to remember in each channel.
+    NEXT_EMOJIS = ["right_arrow", "play_button", "fast-forward_button"]
+    PREVIOUS_EMOJIS = ["left_arrow", "reverse_button", "fast_reverse_button"]
+    QUERY_LIMIT = 4  # number of queries to resolve at once for each message.
+    INDEX_FILE = "resources/cards.db"
+    INDEX_INTERVAL = 60 * 60  # seconds between checks of the bulk file
     BAD_QUERY_MESSAGE = "Illegal character in search string."
 
     def __init__(self, config):
@@ -433,24 +1031,52 @@ class ScryfallHandler(commands.Pattern):
             config,
             regex=r"\[[^\[\]]+\]",
             will_send=True,
-            monitors_reactions=True,
         )
-        self.sent = {}
-        self.sent_channels = {}
+        self.query_limit = config.get(
+            "scryfall_query_limit", ScryfallHandler.QUERY_LIMIT
+        )
+        # Answer card lookups from a local copy of Scryfall's bulk data.
+        bulk_file = config.get("scryfall_bulk_file")
+        if bulk_file:
+            index.open(
+                config.get("scryfall_index_file", ScryfallHandler.INDEX_FILE)
+            )
+            config["client"].loop.create_task(
+                index.refresh_periodically(
+                    bulk_file,
+                    config.get(
+                        "scryfall_index_interval",
+                        ScryfallHandler.INDEX_INTERVAL,
+                    ),
+                    config["client"],
+                )
+            )
 
     async def handle(self, message):
-        async with message.channel.typing():
-            results = [q.get_result() for q in get_queries(message.content)]
-        if results:
-            for result in results:
-                await self.send(result, message.channel)
-        else:
+        queries = get_queries(message.content)
+        if not queries:
             await self.send(ScryfallHandler.BAD_QUERY_MESSAGE, message.channel)
-
-    async def handle_reaction(self, reaction, _):
-        if reaction.message.id not in self.sent:
             return
 
+        # Resolve all queries concurrently, but send results in the order
+        # they appear in the message, each as soon as it and those before it
+        # are ready.
+        semaphore = asyncio.Semaphore(self.query_limit)
+
+        async def resolve(query):
+            async with semaphore:
+                return await query.get_result()
+
+        tasks = [asyncio.ensure_future(resolve(q)) for q in queries]
+        try:
+            async with message.channel.typing():
+                for task in tasks:
+                    await self.send(await task, message.channel)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def handle_reaction(self, reaction, _, sent):
         emoji = utilities.get_emoji_name(reaction.emoji)
         embed_style = None
         for key in ScryfallHandler.EMBED_EMOJI_MAPPING.keys():
@@ -469,13 +1095,36 @@ class ScryfallHandler(commands.Pattern):
 
         if remove_message:
             await reaction.message.delete()
+            commands.reaction_targets.remove(reaction.message.id)
             utilities.log_message("Deleted message.")
             return
 
-        message, sent = self.sent[reaction.message.id]
-        if isinstance(sent, CardList) and index is not None:
+        content = sent.content
+        if isinstance(content, CardList) and (
+            emoji in ScryfallHandler.NEXT_EMOJIS
+            or emoji in ScryfallHandler.PREVIOUS_EMOJIS
+        ):
+            step = 1 if emoji in ScryfallHandler.NEXT_EMOJIS else -1
+            try:
+                await content.show(content.view + step)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                utilities.log_message(f"Failed to page search results: {e}")
+                return
+
+            await reaction.message.edit(embed=content.get_embed())
+            utilities.log_message("Scryfall card list paged.")
+            await reaction.clear()
+            return
+
+        if isinstance(content, CardList) and index is not None:
+            # The pages of the current view may have been evicted since it
+            # was shown, so make sure they are loaded.
             try:
-                card = sent.select_option(index)
+                await content.show(content.view)
+                card = content.select_option(index)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                utilities.log_message(f"Failed to load search results: {e}")
+                return
             except IndexError:
                 return
 
@@ -484,6 +1133,7 @@ class ScryfallHandler(commands.Pattern):
                 self.log_sent(reaction.message, card)
             elif type(card) == DoubleFacedCard:
                 await reaction.message.delete()
+                commands.reaction_targets.remove(reaction.message.id)
                 await self.send(card, reaction.message.channel)
 
             utilities.log_message("Option selected from scryfall card list.")
@@ -492,60 +1142,51 @@ class ScryfallHandler(commands.Pattern):
 
         if embed_style is None:
             return
-        elif embed_style == sent.embed_style:
+        elif embed_style == content.embed_style:
             await reaction.clear()
             return
 
-        if isinstance(sent, Card):
-            await reaction.message.edit(embed=sent.get_embed(embed_style))
+        if isinstance(content, Card):
+            await reaction.message.edit(embed=content.get_embed(embed_style))
         else:
-            utilities.log_message(f"Strange scryfall sent type: {type(sent)}")
+            utilities.log_message(
+                f"Strange scryfall sent type: {type(content)}"
+            )
             return
 
-        if type(sent) in [DoubleFacedCard, BackFace]:
-            for message, content in self.sent.values():
-                if content is sent.other_face:
-                    await message.edit(embed=content.get_embed(embed_style))
+        if sent.other is not None:
+            await sent.other.message.edit(
+                embed=sent.other.content.get_embed(embed_style)
+            )
 
         await reaction.clear()
         utilities.log_message("Scryfall embed size edited.")
 
-    def log_sent(self, message, content):
-        self.sent[message.id] = (message, content)
-        self.reaction_targets.append(message.id)
-
-        if message.channel.id not in self.sent_channels:
-            self.sent_channels[message.channel.id] = []
-        self.sent_channels[message.channel.id].append(message.id)
-        if (
-            len(self.sent_channels[message.channel.id])
-            > ScryfallHandler.MESSAGE_CACHE_SIZE
-        ):
-
-            message_id = self.sent_channels[message.channel.id].pop(0)
-
-            try:
-                del self.sent[message_id]
-            except KeyError:
-                pass
-
-            try:
-                self.reaction_targets.remove(message_id)
-            except ValueError:
-                pass
+    def log_sent(self, message, content, other=None):
+        sent = SentCard(message, content, other)
+        commands.reaction_targets.add(message.id, self, sent)
+        return sent
 
     async def send(self, content, channel):
         if type(content) == str:
             await channel.send(embed=discord.Embed(title=content))
         elif type(content) == discord.Embed:
             await channel.send(embed=content)
-        elif type(content) in [Card, CardList]:
+        elif type(content) == CardList:
+            content.channel_id = channel.id
+            self.log_sent(
+                await channel.send(embed=content.get_embed()), content
+            )
+        elif type(content) == Card:
             self.log_sent(
                 await channel.send(embed=content.get_embed()), content
             )
         elif type(content) == DoubleFacedCard:
             front, back = content.get_embeds()
-            self.log_sent(await channel.send(embed=front), content)
-            self.log_sent(await channel.send(embed=back), content.back_face)
+            front = self.log_sent(await channel.send(embed=front), content)
+            back = self.log_sent(
+                await channel.send(embed=back), content.back_face, front
+            )
+            front.other = back
         else:
             raise TypeError(f"Can't send {content} in {channel}.")
@@ -1,40 +1,66 @@
+import collections
 import difflib
+import heapq
+import math
+import re
 
 import discord
-import requests
+
+import compendium
 
 # More or less copied over from https://github.com/OwenFeik/spells
 
 
 class Spellbook:
-    def __init__(self, spellbook_url):
-        self.build_spellbook(spellbook_url)
+    EMBED_LENGTH = 2048  # longest embed description Discord allows
+    SEARCH_KEYWORD = "find "
+    LOADING_MESSAGE = (
+        "The spellbook is still loading. Please try again in a minute."
+    )
+
+    def __init__(self, data=None):
+        self.spells = {}
+        self.names = []
+        self.index = SpellIndex([])
+        self.facets = FacetIndex([])
+        self.text = TextIndex([])
+        self.embeds = compendium.EmbedCache()
+        if data is not None:
+            self.build_spellbook(data)
 
-    def build_spellbook(self, spellbook_url):
+    # Everything is built before being swapped in, so that lookups never see
+    # a half built spellbook and bad data leaves the old one in place.
+    def build_spellbook(self, data):
         try:
-            self.spells = {
-                spell["name"]: Spell.from_json(spell)
-                for spell in requests.get(spellbook_url).json()
-            }
+            spells = {spell["name"]: Spell.from_json(spell) for spell in data}
 
             alt_names = {}
-            for spell in self.spells.values():
+            for spell in spells.values():
                 if spell.alt_names:
                     for name in spell.alt_names:
                         alt_names[name] = spell
-            self.spells.update(alt_names)
+            spells.update(alt_names)
 
-            self.names = list(self.spells.keys())
-            self._names = [
-                name.lower() for name in self.names
-            ]  # Used to match queries through difflib
+            names = list(spells.keys())
+            index = SpellIndex(names)
+            distinct = [Spell.from_json(spell) for spell in data]
+            facets = FacetIndex(distinct)
+            text = TextIndex(distinct)
         except:
             raise ValueError
 
+        self.spells, self.names, self.index = spells, names, index
+        self.facets, self.text = facets, text
+        self.embeds.reset(self.render_embed)
+
+    def render_embed(self, name):
+        spell = self.spells.get(name)
+        return spell.embed() if spell is not None else None
+
     def get_spell(self, query):
-        target = difflib.get_close_matches(query.lower(), self._names, 1)
+        target = self.index.get(query)
         if target:
-            return self.spells[self.names[self._names.index(target[0])]]
+            return self.spells[target]
         else:
             return None
 
@@ -44,12 +70,324 @@ class Spellbook:
             spells.append(self.get_spell(spell))
         return spells
 
+    # Split a list of spells over as many embeds as it takes.
+    def list_embeds(self, title, names):
+        lines = [
+            f"{name} ({get_level_prefix(self.spells[name].level)})"
+            for name in names
+        ]
+        embeds = []
+        description = ""
+        for line in lines:
+            if len(description) + len(line) + 1 > Spellbook.EMBED_LENGTH:
+                embeds.append(discord.Embed(description=description))
+                description = ""
+            description += line + "\n"
+        embeds.append(discord.Embed(description=description))
+
+        embeds[0].title = title
+        return embeds
+
+    # "find <words>" searches descriptions, unless it names a spell such as
+    # Find Familiar or is the start of one.
+    def is_search(self, string):
+        query = string.lower()
+        return (
+            query.startswith(Spellbook.SEARCH_KEYWORD)
+            and query not in self.index.names
+            and query not in self.index.prefixes
+        )
+
+    def search_embed(self, words):
+        names = self.text.search(words)
+        if not names:
+            return f'Sorry, no spells mention "{words}".'
+
+        e = discord.Embed(title=f'Spells about "{words}"')
+        e.description = "\n".join(
+            f"{i}. {name} ({get_embed_description(self.spells[name])})"
+            for i, name in enumerate(names, 1)
+        )
+        return e
+
     def handle_command(self, string):
+        # Nothing is loaded on a first start until the data is downloaded.
+        if not self.spells:
+            return Spellbook.LOADING_MESSAGE
+
+        if self.is_search(string):
+            return self.search_embed(string[len(Spellbook.SEARCH_KEYWORD) :])
+
+        filters = self.facets.parse(string)
+        if filters is not None:
+            names = self.facets.filter(filters)
+            if not names:
+                return f'Sorry, no spells match "{string}".'
+            return self.list_embeds(
+                f'{len(names)} spells matching "{string}"', names
+            )
+
         spell = self.get_spell(string)
         if spell is None:
             return f'Sorry, I couldn\'t find "{string}".'
         else:
-            return spell.embed()
+            return self.embeds.get(spell.name, spell.embed)
+
+
+class FacetIndex:
+    # Inverted indexes from each level, class, subclass and school to the
+    # names of the spells which have it, and a set of ritual spells, so that
+    # queries like "level:3 class:wizard ritual" are set intersections.
+
+    FACETS = ["level", "class", "subclass", "school"]
+    FLAGS = ["ritual"]
+    TOKEN_REGEX = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))|(\S+)')
+
+    def __init__(self, spells):
+        self.index = {
+            facet: collections.defaultdict(set) for facet in FacetIndex.FACETS
+        }
+        self.flags = {flag: set() for flag in FacetIndex.FLAGS}
+        self.levels = {}  # name: level, for sorting results
+
+        for spell in spells:
+            self.levels[spell.name] = spell.level
+            self.index["level"][str(spell.level)].add(spell.name)
+            self.index["school"][spell.school.lower()].add(spell.name)
+            for c in spell.classes:
+                self.index["class"][c.lower()].add(spell.name)
+            for c in spell.subclasses:
+                self.index["subclass"][c.lower()].add(spell.name)
+            if spell.ritual:
+                self.flags["ritual"].add(spell.name)
+
+    # Returns a list of (facet, value) pairs, value None for flags, or None
+    # if the query isn't made up entirely of filters.
+    def parse(self, query):
+        filters = []
+        for match in FacetIndex.TOKEN_REGEX.finditer(query.lower()):
+            facet, quoted, value, flag = match.groups()
+            if flag in FacetIndex.FLAGS:
+                filters.append((flag, None))
+            elif facet in FacetIndex.FACETS:
+                value = quoted if quoted is not None else value
+                if facet == "level":
+                    value = (
+                        "0" if value == "cantrip" else value.rstrip("stndrh")
+                    )
+                filters.append((facet, value))
+            else:
+                return None
+        return filters or None
+
+    def filter(self, filters):
+        sets = sorted(
+            [
+                (
+                    self.flags[facet]
+                    if value is None
+                    else self.index[facet].get(value, set())
+                )
+                for facet, value in filters
+            ],
+            key=len,
+        )
+        names = sets[0].intersection(*sets[1:])
+        return sorted(names, key=lambda n: (self.levels[n], n))
+
+
+class TextIndex:
+    # BM25 ranked inverted index over the names and descriptions of spells,
+    # with words in names counted NAME_WEIGHT times.
+
+    K1 = 1.2
+    B = 0.75
+    NAME_WEIGHT = 3
+    LIMIT = 10  # number of results to return
+    WORD_REGEX = re.compile(r"[a-z0-9]+")
+    STOP_WORDS = set(
+        "a an and are as at be by for from in is it its of on or that the to "
+        "with".split()
+    )
+
+    def __init__(self, spells):
+        self.postings = collections.defaultdict(dict)  # term: {name: count}
+        self.lengths = {}  # name: number of terms
+
+        for spell in spells:
+            terms = TextIndex.terms(spell.name) * TextIndex.NAME_WEIGHT
+            terms += TextIndex.terms(spell.desc)
+            self.lengths[spell.name] = len(terms)
+            for term, count in collections.Counter(terms).items():
+                self.postings[term][spell.name] = count
+
+        # BM25's length normalisation of each spell's term counts.
+        average = sum(self.lengths.values()) / max(len(self.lengths), 1) or 1
+        self.norms = {
+            name: TextIndex.K1
+            * (1 - TextIndex.B + TextIndex.B * length / average)
+            for name, length in self.lengths.items()
+        }
+
+    @staticmethod
+    def terms(text):
+        terms = []
+        for word in TextIndex.WORD_REGEX.findall(text.lower()):
+            if word in TextIndex.STOP_WORDS:
+                continue
+            # Crude stemming, so that "creatures" finds "creature".
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            terms.append(word)
+        return terms
+
+    def search(self, query, limit=LIMIT):
+        scores = collections.defaultdict(float)
+        for term in set(TextIndex.terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(
+                1
+                + (len(self.lengths) - len(postings) + 0.5)
+                / (len(postings) + 0.5)
+            )
+            for name, count in postings.items():
+                scores[name] += (
+                    idf
+                    * count
+                    * (TextIndex.K1 + 1)
+                    / (count + self.norms[name])
+                )
+
+        return heapq.nlargest(limit, scores, key=lambda n: (scores[n], n))
+
+
+class SpellIndex:
+    # Finds the same closest name to a query as difflib.get_close_matches,
+    # but first compares the query only with likely candidates: names it is a
+    # prefix or substring of, names sharing a word with it, and names whose
+    # first PREFIX_LENGTH characters are within MAX_EDITS deletions of its
+    # own. The deletion variants of each name are computed up front, SymSpell
+    # style, so that finding candidates is a handful of dict lookups. Other
+    # names are then only compared if they could beat the best candidate:
+    # a ratio is at most twice the number of characters the two strings
+    # share over their total length, which is counted for every name at once
+    # from an index of the characters in each name.
+
+    MAX_EDITS = 2
+    PREFIX_LENGTH = 7
+    MIN_PREFIX = 3  # shortest query matched as a prefix of names
+    CUTOFF = 0.6  # minimum similarity, as in difflib
+
+    def __init__(self, names):
+        self.names = {}  # lowercase name: name
+        self.prefixes = collections.defaultdict(set)
+        self.words = collections.defaultdict(set)
+        self.trigrams = collections.defaultdict(set)
+        self.deletes = collections.defaultdict(set)
+        self.characters = collections.defaultdict(list)  # char: [(name, n)]
+
+        for name in names:
+            key = name.lower()
+            if key in self.names:
+                continue
+            self.names[key] = name
+            for char, count in collections.Counter(key).items():
+                self.characters[char].append((key, count))
+            for i in range(SpellIndex.MIN_PREFIX, len(key)):
+                self.prefixes[key[:i]].add(key)
+            for word in key.split():
+                self.words[word].add(key)
+            for trigram in SpellIndex.get_trigrams(key):
+                self.trigrams[trigram].add(key)
+            for variant in SpellIndex.get_deletes(key):
+                self.deletes[variant].add(key)
+
+    @staticmethod
+    def get_trigrams(string):
+        return {string[i : i + 3] for i in range(len(string) - 2)}
+
+    @staticmethod
+    def get_deletes(string):
+        string = string[: SpellIndex.PREFIX_LENGTH]
+        variants = {string}
+        edge = {string}
+        for _ in range(SpellIndex.MAX_EDITS):
+            edge = {
+                word[:i] + word[i + 1 :]
+                for word in edge
+                for i in range(len(word))
+            }
+            variants.update(edge)
+        return variants
+
+    def candidates(self, query):
+        found = set(self.prefixes.get(query, ()))
+        for word in query.split():
+            found.update(self.words.get(word, ()))
+        for variant in SpellIndex.get_deletes(query):
+            found.update(self.deletes.get(variant, ()))
+
+        # Names containing the query contain all of its trigrams.
+        trigrams = SpellIndex.get_trigrams(query)
+        if trigrams:
+            found.update(
+                set.intersection(
+                    *[self.trigrams.get(t, set()) for t in trigrams]
+                )
+            )
+        return found
+
+    # Returns (ratio, key) of the closest key at least cutoff similar to the
+    # query and better than best, ranked as get_close_matches ranks, ties
+    # going to the greater name.
+    @staticmethod
+    def best_match(query, keys, best=None):
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)
+        cutoff = max(SpellIndex.CUTOFF, best[0]) if best else SpellIndex.CUTOFF
+        for key in keys:
+            matcher.set_seq1(key)
+            if (
+                matcher.real_quick_ratio() >= cutoff
+                and matcher.quick_ratio() >= cutoff
+            ):
+                ratio = matcher.ratio()
+                if ratio >= cutoff and (best is None or (ratio, key) > best):
+                    best = (ratio, key)
+                    cutoff = ratio
+        return best
+
+    # Names which share enough characters with query to be at least cutoff
+    # similar to it, the same bound as SequenceMatcher.quick_ratio.
+    def within_reach(self, query, cutoff):
+        shared = collections.Counter()
+        for char, count in collections.Counter(query).items():
+            for key, n in self.characters.get(char, ()):
+                shared[key] += min(count, n)
+        return [
+            key
+            for key, n in shared.items()
+            if 2.0 * n / (len(key) + len(query)) >= cutoff
+        ]
+
+    def get(self, query):
+        query = query.lower()
+        if query in self.names:
+            return self.names[query]
+
+        candidates = self.candidates(query)
+        best = SpellIndex.best_match(query, candidates)
+        cutoff = best[0] if best else SpellIndex.CUTOFF
+        others = [
+            key
+            for key in self.within_reach(query, cutoff)
+            if key not in candidates
+        ]
+        best = SpellIndex.best_match(query, others, best)
+        return self.names[best[1]] if best else None
 
 
 class Spell:
@@ -0,0 +1,47 @@
+# A local stand-in for the server hosting the spell and monster data, used by
+# tests. Serves data at /data.json, answering conditional requests.
+
+import json
+
+from aiohttp import web
+
+
+class StubCompendium:
+    def __init__(self, data):
+        self.version = 0
+        self.text = None
+        self.set_data(data)
+        self.requests = []  # status of each response sent
+        self.runner = None
+        self.url = None
+
+    def set_data(self, data):
+        self.version += 1
+        self.text = data if isinstance(data, str) else json.dumps(data)
+
+    async def data(self, request):
+        etag = f'"{self.version}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.requests.append(304)
+            return web.Response(status=304)
+
+        self.requests.append(200)
+        return web.Response(
+            text=self.text,
+            content_type="application/json",
+            headers={"ETag": etag},
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/data.json", self.data)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/data.json"
+
+    async def stop(self):
+        await self.runner.cleanup()
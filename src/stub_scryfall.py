@@ -0,0 +1,117 @@
+# A local stand-in for the Scryfall API, used by tests and benchmarks.
+# Every card name exists unless it is listed in missing. Like Scryfall, the
+# collection endpoint returns names in their own capitalisation, makes no
+# promise about the order of the cards, and returns art cards without images.
+
+import asyncio
+import string
+
+from aiohttp import web
+
+import scryfall
+
+
+def card_json(name, ed="tst"):
+    return {
+        "object": "card",
+        "name": name,
+        "set": ed,
+        "color_identity": [],
+        "prices": {"usd": "1.00", "usd_foil": None},
+        "image_uris": {
+            "normal": f"https://img.example/{name}.jpg",
+            "art_crop": f"https://img.example/{name}_art.jpg",
+        },
+    }
+
+
+class StubScryfall:
+    def __init__(self, latency=0, missing=None):
+        self.latency = latency  # seconds to wait before each response
+        self.missing = set(missing or [])
+        self.requests = []  # (path, query) of each request received
+        self.search_total = 10  # number of results for each search
+        self.page_size = 175  # results in each page of a search
+        self.runner = None
+        self.url = None
+        self.old_url = None
+
+    def card(self, name):
+        if name.lower() in self.missing:
+            return None
+        return card_json(name)
+
+    async def respond(self, request, data):
+        self.requests.append((request.path, dict(request.query)))
+        await asyncio.sleep(self.latency)
+        if data is None:
+            return web.json_response(
+                {"object": "error", "status": 404}, status=404
+            )
+        return web.json_response(data)
+
+    async def named(self, request):
+        return await self.respond(
+            request, self.card(request.query.get("fuzzy", ""))
+        )
+
+    async def search(self, request):
+        query = request.query.get("q", "")
+        page = int(request.query.get("page", 1))
+        start = (page - 1) * self.page_size
+        end = min(start + self.page_size, self.search_total)
+        data = {
+            "object": "list",
+            "total_cards": self.search_total,
+            "has_more": end < self.search_total,
+            "data": [
+                card_json(f"{query} {i}") for i in range(start + 1, end + 1)
+            ],
+        }
+        if data["has_more"]:
+            data["next_page"] = f"{self.url}search?q={query}&page={page + 1}"
+        return await self.respond(request, data)
+
+    async def collection(self, request):
+        identifiers = (await request.json())["identifiers"]
+        data, not_found = [], []
+        for identifier in identifiers:
+            card = self.card(string.capwords(identifier["name"]))
+            if card is None:
+                not_found.append({k: v.lower() for k, v in identifier.items()})
+                continue
+
+            card["set"] = identifier.get("set", card["set"])
+            if card["name"].endswith(" Art"):
+                del card["image_uris"]
+            data.append(card)
+
+        return await self.respond(
+            request,
+            {"object": "list", "not_found": not_found, "data": data[::-1]},
+        )
+
+    async def random(self, request):
+        return await self.respond(request, card_json("Random Card"))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/cards/named", self.named)
+        app.router.add_get("/cards/search", self.search)
+        app.router.add_get("/cards/random", self.random)
+        app.router.add_post("/cards/collection", self.collection)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        self.url = f"http://127.0.0.1:{port}/cards/"
+        self.old_url = scryfall.ScryfallRequest.BASE_URL
+        scryfall.ScryfallRequest.BASE_URL = self.url
+
+    async def stop(self):
+        scryfall.ScryfallRequest.BASE_URL = self.old_url
+        await scryfall.client.close()
+        await self.runner.cleanup()
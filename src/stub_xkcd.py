@@ -0,0 +1,70 @@
+# A local stand-in for xkcd's JSON API, used by tests and benchmarks.
+# Comics listed in flaky fail with a server error that many times before
+# they are served. Comics added as strings are served as they are, to stand
+# in for malformed responses.
+
+from aiohttp import web
+
+
+def comic_json(idno, title=None, alt=None):
+    title = title or f"Comic {idno}"
+    return {
+        "num": idno,
+        "safe_title": title,
+        "title": title,
+        "img": f"https://imgs.xkcd.com/comics/comic_{idno}.png",
+        "alt": alt or f"Alt text of comic {idno}.",
+    }
+
+
+class StubXKCD:
+    def __init__(self, newest=10, flaky=None):
+        self.comics = {
+            i: comic_json(i) for i in range(1, newest + 1) if i != 404
+        }
+        self.flaky = dict(flaky or {})  # id: number of failures left
+        self.requests = []  # path of each request received
+        self.runner = None
+        self.url = None
+
+    def add(self, data, idno=None):
+        self.comics[data["num"] if idno is None else idno] = data
+
+    @staticmethod
+    def respond(data, headers=None):
+        if isinstance(data, str):
+            return web.Response(text=data, headers=headers)
+        return web.json_response(data, headers=headers)
+
+    async def newest(self, request):
+        self.requests.append(request.path)
+        newest = max(self.comics)
+        etag = f'"{newest}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return StubXKCD.respond(self.comics[newest], {"ETag": etag})
+
+    async def comic(self, request):
+        self.requests.append(request.path)
+        idno = int(request.match_info["idno"])
+        if self.flaky.get(idno):
+            self.flaky[idno] -= 1
+            return web.Response(status=500)
+        elif idno not in self.comics:
+            return web.Response(status=404)
+        return StubXKCD.respond(self.comics[idno])
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/info.0.json", self.newest)
+        app.router.add_get(r"/{idno:\d+}/info.0.json", self.comic)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
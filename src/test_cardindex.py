@@ -0,0 +1,103 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import cardindex
+import utilities
+
+
+def card(name, ed, released, faces=None, layout="normal", digital=False):
+    data = {
+        "object": "card",
+        "name": name,
+        "set": ed,
+        "released_at": released,
+        "layout": layout,
+        "digital": digital,
+        "color_identity": ["U"],
+        "prices": {"usd": "0.25", "usd_foil": None},
+    }
+    image_uris = {"normal": f"{name}.jpg", "art_crop": f"{name}_art.jpg"}
+    if faces:
+        data["card_faces"] = [
+            {"name": face, "image_uris": image_uris} for face in faces
+        ]
+    else:
+        data["image_uris"] = image_uris
+    return data
+
+
+CARDS = [
+    card("Counterspell", "lea", "1993-08-05"),
+    card("Counterspell", "mh2", "2021-06-18"),
+    card("Jace, the Mind Sculptor", "wwk", "2010-02-05"),
+    card(
+        "Delver of Secrets // Insectile Aberration",
+        "isd",
+        "2011-09-30",
+        ["Delver of Secrets", "Insectile Aberration"],
+    ),
+    {"object": "card", "name": "Art Series", "set": "aafr"},
+    # Newer printings which are not real cards.
+    card("Counterspell", "tmh2", "2021-06-19", layout="token"),
+    card("Counterspell", "amh2", "2021-06-20", layout="art_series"),
+    card("Counterspell", "prm", "2021-06-21", digital=True),
+    card("Jace Emblem", "wwk", "2010-02-05", layout="emblem"),
+]
+
+
+class TestCardIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        cls.source = os.path.join(cls.dir.name, "cards.json")
+        with open(cls.source, "w") as f:
+            json.dump(CARDS, f, indent=4)
+
+        cls.index = cardindex.CardIndex(os.path.join(cls.dir.name, "cards.db"))
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(cls.index.refresh(cls.source))
+        loop.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.connection.close()
+        cls.dir.cleanup()
+
+    def testStreamsArray(self):
+        text = json.dumps(CARDS)
+        items = list(cardindex.iter_json_array(io.StringIO(text), 7))
+        self.assertEqual(items, CARDS)
+
+        with self.assertRaises(ValueError):
+            list(cardindex.iter_json_array(io.StringIO(text[:-20]), 7))
+
+    def testExact(self):
+        data = self.index.lookup("COUNTERSPELL")
+        self.assertEqual((data["name"], data["set"]), ("Counterspell", "mh2"))
+
+    def testEdition(self):
+        self.assertEqual(self.index.lookup("Counterspell", "LEA")["set"], "lea")
+        self.assertIsNone(self.index.lookup("Counterspell", "wwk"))
+
+    def testFuzzy(self):
+        for query in ["jace the mind sculptor", "jace, the mind", "Insectile"]:
+            self.assertIsNotNone(self.index.lookup(query), query)
+
+        data = self.index.lookup("delver of secrets")
+        self.assertEqual(len(data["card_faces"]), 2)
+
+        # Too short or ambiguous prefixes are left to Scryfall.
+        self.assertIsNone(self.index.lookup("Cou"))
+        self.assertIsNone(self.index.lookup("Art Series"))
+        self.assertIsNone(self.index.lookup("Black Lotus"))
+
+    def testSkipsNonCards(self):
+        for ed in ["tmh2", "amh2", "prm"]:
+            self.assertIsNone(self.index.lookup("Counterspell", ed), ed)
+        self.assertEqual(self.index.lookup("Counterspell")["set"], "mh2")
+        self.assertIsNone(self.index.lookup("Jace Emblem"))
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import aiohttp
+
+import bestiary
+import compendium
+import spellbook
+import stub_compendium
+import utilities
+
+SPELLS = [
+    {"name": "Fireball", "level": 3, "school": "Evocation"},
+    {"name": "Magic Missile", "level": 1, "school": "Evocation"},
+]
+
+
+class TestCompendium(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        cls.stub = stub_compendium.StubCompendium(SPELLS)
+        cls.loop.run_until_complete(cls.stub.start())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(cls.stub.stop())
+        cls.loop.close()
+        cls.dir.cleanup()
+
+    def revalidate(self, data):
+        async def revalidate():
+            async with aiohttp.ClientSession() as session:
+                return await data.revalidate(session)
+
+        return self.loop.run_until_complete(revalidate())
+
+    def testRevalidation(self):
+        path = os.path.join(self.dir.name, "spells.json")
+        data = compendium.Compendium(self.stub.url, path)
+        self.assertIsNone(data.load())
+
+        sb = spellbook.Spellbook(data.load())
+        data.listeners.append(sb.build_spellbook)
+        self.assertIsNone(sb.get_spell("fireball"))
+        self.assertEqual(
+            sb.handle_command("fireball"), spellbook.Spellbook.LOADING_MESSAGE
+        )
+        self.assertEqual(
+            bestiary.Bestiary().handle_command("goblin"),
+            bestiary.Bestiary.LOADING_MESSAGE,
+        )
+
+        self.assertTrue(self.revalidate(data))
+        self.assertEqual(sb.get_spell("fireball").level, 3)
+        self.assertEqual(data.load(), SPELLS)
+
+        # An unchanged dataset costs a 304 and leaves everything as it was.
+        self.assertFalse(self.revalidate(data))
+        self.assertEqual(self.stub.requests[-1], 304)
+
+        # Bad data is neither used nor saved.
+        self.stub.set_data([{"level": 9}])
+        with self.assertRaises(ValueError):
+            self.revalidate(data)
+        self.assertEqual(data.load(), SPELLS)
+        self.assertIsNotNone(sb.get_spell("magic missile"))
+
+        self.stub.set_data(SPELLS[:1])
+        self.assertTrue(self.revalidate(data))
+        self.assertEqual(sb.get_spell("magic missile"), None)
+
+        # A restart uses the copy on disk and its validators.
+        restarted = compendium.Compendium(self.stub.url, path)
+        self.assertEqual(restarted.load(), SPELLS[:1])
+        self.assertFalse(self.revalidate(restarted))
+        self.assertEqual(
+            [f for f in os.listdir(self.dir.name) if f.endswith(".tmp")], []
+        )
+
+        # A copy which can't be loaded or built is downloaded again, despite
+        # its validators.
+        restarted.load()
+        restarted.invalidate()
+        self.assertTrue(self.revalidate(restarted))
+
+        with open(path, "w") as f:
+            f.write("[{")
+        restarted = compendium.Compendium(self.stub.url, path)
+        self.assertIsNone(restarted.load())
+        self.assertTrue(self.revalidate(restarted))
+        self.assertEqual(restarted.load(), SPELLS[:1])
+
+    def testEmbedCache(self):
+        popular = os.path.join(self.dir.name, "spells.json.popular")
+        sb = spellbook.Spellbook()
+        sb.embeds = compendium.EmbedCache(1, 1, popular)
+        sb.build_spellbook(SPELLS)
+
+        first = sb.handle_command("fireball")
+        second = sb.handle_command("FIREBALL")
+        self.assertIsNot(first, second)
+        self.assertEqual(first.to_dict(), second.to_dict())
+        self.assertEqual((sb.embeds.hits, sb.embeds.misses), (1, 1))
+
+        # Changing a returned embed changes neither the cache nor other
+        # embeds from it.
+        fields = len(first.fields)
+        first.add_field(name="Changed", value="first")
+        second.add_field(name="Changed", value="second")
+        self.assertEqual(len(sb.handle_command("fireball").fields), fields)
+
+        sb.handle_command("magic missile")
+        self.assertEqual(list(sb.embeds.entries), ["Magic Missile"])
+
+        # Reloading forgets rendered embeds, then renders the most popular.
+        sb.build_spellbook(SPELLS)
+        self.assertEqual(list(sb.embeds.entries), ["Fireball"])
+
+        # Request counts are saved for warming the cache after a restart.
+        for _ in range(compendium.EmbedCache.SAVE_EVERY):
+            sb.handle_command("magic missile")
+        restarted = spellbook.Spellbook()
+        restarted.embeds = compendium.EmbedCache(1, 1, popular)
+        restarted.build_spellbook(SPELLS)
+        self.assertEqual(list(restarted.embeds.entries), ["Magic Missile"])
@@ -0,0 +1,332 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import campaign
+import database
+import utilities
+
+
+class User:
+    def __init__(self, idno, name):
+        self.id = idno
+        self.name = name
+
+
+class TestDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        cls.discord_db = database.Discord_Database()
+        cls.roll_db = database.Roll_Database()
+        cls.campaign_db = database.Campaign_Database()
+        cls.loop.run_until_complete(
+            database.init_db(os.path.join(cls.dir.name, "test.db"))
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(database.database.close())
+        cls.loop.close()
+        cls.dir.cleanup()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def testRegistryOnlyWritesChanges(self):
+        db = self.discord_db
+        hits, misses = db.hits, db.misses
+
+        for _ in range(3):
+            self.run_async(db.insert_user(User(1, "owen")))
+        self.assertEqual(db.misses - misses, 1)
+        self.assertEqual(db.hits - hits, 2)
+        self.assertEqual(len(db.pending), 1)
+
+        self.run_async(db.flush())
+        self.assertEqual(db.pending, {})
+        self.assertEqual(
+            self.run_async(database.database.execute("SELECT * FROM users;")),
+            [(1, "owen")],
+        )
+
+        self.run_async(db.insert_user(User(1, "feik")))
+        self.assertEqual(db.misses - misses, 2)
+        self.run_async(db.flush())
+        self.assertEqual(
+            self.run_async(database.database.execute("SELECT * FROM users;")),
+            [(1, "feik")],
+        )
+
+    def testRegistryRetriesFailedWrites(self):
+        db = self.discord_db
+        execute = database.database.execute
+        commit = database.TransTypes.COMMIT
+        self.run_async(
+            execute(
+                "CREATE TEMP TRIGGER reject BEFORE INSERT ON servers "
+                "BEGIN SELECT RAISE(ABORT, 'rejected'); END;",
+                trans_type=commit,
+            )
+        )
+        try:
+            self.run_async(db.insert_server(User(7, "guild")))
+            self.run_async(db.flush())
+            self.assertEqual(db.pending, {("servers", 7): "guild"})
+        finally:
+            self.run_async(execute("DROP TRIGGER reject;", trans_type=commit))
+
+        self.run_async(db.flush())
+        self.assertEqual(db.pending, {})
+        self.assertEqual(
+            self.run_async(execute("SELECT * FROM servers WHERE id = 7;")),
+            [(7, "guild")],
+        )
+        self.run_async(
+            execute("DELETE FROM servers WHERE id = 7;", trans_type=commit)
+        )
+
+    def testGroupCommit(self):
+        db = database.database
+        self.run_async(asyncio.sleep(db.flush_interval))
+        db.flush_interval = 60
+        db.batch_size = 3
+        other = sqlite3.connect(db.file)
+        count = lambda: other.execute(
+            "SELECT COUNT(*) FROM servers;"
+        ).fetchone()
+
+        try:
+            for i in range(2):
+                self.run_async(
+                    db.execute(
+                        "INSERT INTO servers VALUES(?, ?);",
+                        (i, "server"),
+                        database.TransTypes.COMMIT,
+                    )
+                )
+            self.assertEqual(count(), (0,))
+
+            self.run_async(
+                db.execute(
+                    "INSERT INTO servers VALUES(?, ?);",
+                    (2, "server"),
+                    database.TransTypes.COMMIT,
+                )
+            )
+            self.assertEqual(count(), (3,))
+
+            self.run_async(
+                db.execute(
+                    "DELETE FROM servers;",
+                    trans_type=database.TransTypes.COMMIT,
+                )
+            )
+            self.assertEqual(count(), (3,))
+            self.run_async(db.sync())
+            self.assertEqual(count(), (0,))
+        finally:
+            other.close()
+            db.flush_interval = 0.05
+            db.batch_size = 100
+
+    def testRollStats(self):
+        db = self.roll_db
+        user, server = User(1, "owen"), User(2, "server")
+
+        self.run_async(
+            db.insert_rolls([("2d6", "3,5"), ("1d6", "6")], user, server)
+        )
+        self.run_async(db.insert_roll("1d20", "20", user, server))
+        self.run_async(db.insert_roll("1d20", "1", user, User(3, "other")))
+        expected = [(6, 3, 14, 70), (20, 1, 20, 400)]
+        self.assertEqual(
+            self.run_async(db.get_roll_stats(user, server)), expected
+        )
+
+        self.run_async(
+            database.database.execute(
+                "DELETE FROM roll_stats;", trans_type=database.TransTypes.COMMIT
+            )
+        )
+        self.run_async(database.database.backfill_roll_stats())
+        self.assertEqual(
+            self.run_async(db.get_roll_stats(user, server)), expected
+        )
+
+        self.run_async(db.reset_rolls(user, server))
+        self.assertEqual(self.run_async(db.get_roll_stats(user, server)), [])
+
+    def testRollsCommittedWithStats(self):
+        db = database.database
+        self.run_async(db.sync())
+        db.flush_interval = 60
+        db.batch_size = 3
+        user, server = User(4, "someone"), User(5, "server")
+        other = sqlite3.connect(db.file)
+        count = lambda: other.execute(
+            "SELECT (SELECT COUNT(*) FROM rolls WHERE user = 4), "
+            "(SELECT SUM(count) FROM roll_stats WHERE user = 4);"
+        ).fetchone()
+
+        try:
+            self.run_async(
+                self.roll_db.insert_rolls(
+                    [("1d6", "3"), ("1d6", "4")], user, server
+                )
+            )
+            self.assertEqual(count(), (2, 2))
+            self.run_async(
+                self.roll_db.insert_rolls([("1d6", "6")], user, server)
+            )
+            self.run_async(db.sync())
+            self.assertEqual(count(), (3, 3))
+            self.assertEqual(
+                self.run_async(self.roll_db.get_roll_stats(user, server)),
+                [(6, 3, 13, 61)],
+            )
+        finally:
+            other.close()
+            db.flush_interval = 0.05
+            db.batch_size = 100
+            self.run_async(self.roll_db.reset_rolls(user, server))
+
+    def testCampaignPlayers(self):
+        db = self.campaign_db
+        camp = campaign.Campaign("Strahd", 10, dm=1)
+        camp.add_player(1, "Ireena, the Bride")
+        camp.add_player(11)
+        self.run_async(db.add_campaign(camp))
+        (campaign_id,) = self.run_async(
+            database.database.execute(
+                "SELECT id FROM campaigns WHERE name = 'Strahd';",
+                trans_type=database.TransTypes.GETONE,
+            )
+        )
+
+        camp.remove_player(11)
+        camp.add_player(111, "Ismark")
+        self.run_async(db.add_campaign(camp))
+        loaded = campaign.Campaign.from_db_tup(
+            self.run_async(db.get_active_campaign(10)), 10
+        )
+        self.assertEqual(loaded.players, [1, 111])
+        self.assertEqual(loaded.nicks, ["Ireena, the Bride", "Ismark"])
+
+        # User 11 is a substring of user 111 but no longer in the campaign.
+        roll_db = self.roll_db
+        self.assertEqual(
+            self.run_async(roll_db.get_active_campaign(User(111, ""), 10)),
+            (campaign_id, "Strahd"),
+        )
+        with self.assertRaises(ValueError):
+            self.run_async(roll_db.get_active_campaign(User(11, ""), 10))
+
+        # Convert legacy comma separated membership.
+        self.run_async(
+            database.database.execute(
+                "UPDATE campaigns SET players = '1,11', nicks = '\"A\",\"\"';",
+                trans_type=database.TransTypes.COMMIT,
+            )
+        )
+        self.run_async(
+            database.database.execute(
+                "DELETE FROM campaign_players;",
+                trans_type=database.TransTypes.COMMIT,
+            )
+        )
+        self.run_async(database.database.convert_campaign_players())
+        self.assertEqual(
+            self.run_async(db.get_players(campaign_id)), [(1, "A"), (11, "")]
+        )
+
+        self.run_async(db.delete_campaign(camp))
+        self.assertEqual(self.run_async(db.get_players(campaign_id)), [])
+
+
+class TestWALDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        database.Discord_Database()
+        cls.loop.run_until_complete(
+            database.init_db(
+                os.path.join(cls.dir.name, "test.db"), wal=True, readers=2
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(database.database.close())
+        cls.loop.close()
+        cls.dir.cleanup()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def testReadsUseReaderPool(self):
+        db = database.database
+        self.assertEqual(
+            self.run_async(db.execute("PRAGMA journal_mode;")), [("wal",)]
+        )
+        self.run_async(
+            db.execute(
+                "INSERT INTO users VALUES(?, ?);",
+                (1, "owen"),
+                database.TransTypes.COMMIT,
+            )
+        )
+        # Uncommitted writes are read from the main connection, without
+        # committing them early.
+        self.assertEqual(
+            self.run_async(db.execute("SELECT * FROM users;")), [(1, "owen")]
+        )
+        self.assertEqual(db.stats()["pending_writes"], 1)
+
+        self.run_async(db.sync())
+        self.assertEqual(
+            self.run_async(db.execute("SELECT * FROM users;")), [(1, "owen")]
+        )
+        self.assertEqual(db.stats()["readers"], 2)
+
+        # Reads made while a commit is under way also see its writes.
+        self.run_async(
+            db.execute(
+                "INSERT INTO users VALUES(?, ?);",
+                (2, "feik"),
+                database.TransTypes.COMMIT,
+            )
+        )
+
+        async def read_during_commit():
+            commit = asyncio.ensure_future(db.sync())
+            await asyncio.sleep(0)
+            self.assertEqual(db.stats()["committing"], 1)
+            rows = await db.execute("SELECT COUNT(*) FROM users;")
+            await commit
+            return rows
+
+        self.assertEqual(self.run_async(read_during_commit()), [(2,)])
+        self.assertEqual(db.stats()["queued_writes"], 0)
+        self.run_async(
+            db.execute(
+                "DELETE FROM users WHERE id = 2;",
+                trans_type=database.TransTypes.COMMIT,
+                durable=True,
+            )
+        )
+        self.assertEqual(db.stats()["idle_readers"], 2)
+
+        # Read-only connections reject writes.
+        self.run_async(db.execute("DELETE FROM users;"))
+        self.assertEqual(
+            self.run_async(db.execute("SELECT COUNT(*) FROM users;")), [(1,)]
+        )
@@ -0,0 +1,304 @@
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+import unittest
+
+import commands
+import scryfall
+import stub_scryfall
+import utilities
+
+
+class Message:
+    ids = itertools.count()
+
+    def __init__(self, channel, embed=None):
+        self.id = next(Message.ids)
+        self.channel = channel
+        self.embed = embed
+
+    async def edit(self, embed=None):
+        self.embed = embed
+
+
+class Reaction:
+    def __init__(self, emoji, message):
+        self.emoji = emoji
+        self.message = message
+        self.cleared = False
+
+    async def clear(self):
+        self.cleared = True
+
+
+class Channel:
+    id = 0
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, embed=None):
+        self.sent.append(Message(self, embed))
+        return self.sent[-1]
+
+
+class TestScryfall(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        cls.stub = stub_scryfall.StubScryfall(missing=["nonexistent card"])
+        cls.loop.run_until_complete(cls.stub.start())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(cls.stub.stop())
+        cls.loop.close()
+        cls.dir.cleanup()
+
+    def setUp(self):
+        self.stub.requests.clear()
+        scryfall.client.cache.flush()
+
+    def resolve(self, content):
+        return [
+            self.loop.run_until_complete(q.get_result())
+            for q in scryfall.get_queries(content)
+        ]
+
+    def testCacheNormalisesQueries(self):
+        first, second = self.resolve("[Sol Ring] [  sol   RING ]")
+        self.assertEqual(first.name, "Sol Ring")
+        self.assertEqual(second.name, "Sol Ring")
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(scryfall.client.cache.stats()["hits"], 1)
+
+    def testCacheNotFound(self):
+        self.resolve("[nonexistent card]")
+        requests = len(self.stub.requests)
+        self.resolve("[Nonexistent Card]")
+        self.assertEqual(len(self.stub.requests), requests)
+
+    def testRandomBypassesCache(self):
+        self.resolve("[random] [random]")
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def testCacheEviction(self):
+        cache = scryfall.ResponseCache(max_size=10)
+        cache.put("a", {"object": "card"}, 6)
+        cache.put("b", {"object": "card"}, 6)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("B"), {"object": "card"})
+        self.assertEqual(cache.evictions, 1)
+
+    def testReactionTargets(self):
+        handler = scryfall.ScryfallHandler({"scryfall": True})
+        channel = Channel()
+        card = scryfall.card_from_scryfall_response(
+            dict(
+                stub_scryfall.card_json("Delver of Secrets"),
+                card_faces=[
+                    stub_scryfall.card_json("Delver of Secrets"),
+                    stub_scryfall.card_json("Insectile Aberration"),
+                ],
+            )
+        )
+        self.loop.run_until_complete(handler.send(card, channel))
+
+        front, back = [
+            commands.reaction_targets.get(m.id) for m in channel.sent
+        ]
+        self.assertIs(front[0], handler)
+        self.assertIs(front[1].other, back[1])
+        self.assertIs(back[1].other, front[1])
+        self.assertIs(back[1].content, card.back_face)
+
+        targets = commands.ReactionTargets(capacity=2)
+        targets.add(1, handler)
+        targets.add(2, handler)
+        targets.get(1)
+        targets.add(3, handler)
+        self.assertIsNone(targets.get(2))
+        self.assertEqual(len(targets), 2)
+
+    def testCardListIsLazy(self):
+        (cards,) = self.resolve("[?t:creature]")
+        self.assertIsInstance(cards, scryfall.CardList)
+        self.assertEqual(len(cards.get_embed().description.split("\n")), 5)
+        self.assertEqual(cards.cards, {})
+
+        card = cards.select_option(0)
+        self.assertEqual(card.name, cards.get_data(cards.results[0])["name"])
+        self.assertIs(cards.select_option(0), card)
+        self.assertEqual(len(cards.cards), 1)
+        with self.assertRaises(AttributeError):
+            card.extra = None
+
+    def testCardListPaging(self):
+        self.stub.search_total, self.stub.page_size = 40, 10
+        limit = scryfall.page_budget.limit
+        scryfall.page_budget.limit = 1
+        try:
+            (cards,) = self.resolve("[?t:goblin]")
+            cards.channel_id = Channel.id
+            self.assertEqual(
+                cards.get_embed().footer.text, "1-5 of 40 results."
+            )
+
+            # Moving to the second view prefetches the second page.
+            self.loop.run_until_complete(cards.show(1))
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+            self.assertEqual(len(cards.pages), 2)
+            self.assertEqual(self.stub.requests[-1][1]["page"], "2")
+
+            self.loop.run_until_complete(cards.show(5))
+            self.assertEqual(cards.select_option(0).name, "t:goblin 26")
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+
+            # Only one page after the first is kept for the channel, and
+            # pages after the first aren't also held by the response cache.
+            self.assertEqual(
+                [page is not None for page in cards.pages],
+                [True, False, False, True],
+            )
+            self.assertEqual(scryfall.client.cache.stats()["entries"], 1)
+            self.loop.run_until_complete(cards.show(100))
+            self.assertEqual(cards.view, 7)
+            self.loop.run_until_complete(cards.show(-1))
+            self.assertEqual(cards.view, 0)
+        finally:
+            self.stub.search_total, self.stub.page_size = 10, 175
+            scryfall.page_budget.limit = limit
+
+    def testConfigure(self):
+        client, budget = scryfall.client, scryfall.page_budget
+        try:
+            scryfall.configure(
+                {"scryfall_rate_limit": 5, "scryfall_prefetch_pages": 2}
+            )
+            self.assertIsNot(scryfall.client, client)
+            self.assertEqual(scryfall.client.limiter.rate, 5)
+            self.assertEqual(
+                scryfall.client.cache.max_size, scryfall.ResponseCache.MAX_SIZE
+            )
+            self.assertEqual(scryfall.page_budget.limit, 2)
+        finally:
+            scryfall.client, scryfall.page_budget = client, budget
+
+    def testPageBudget(self):
+        class Cards:
+            def __init__(self):
+                self.pages = ["page"] * 3
+
+        budget = scryfall.PageBudget(limit=2, max_channels=2)
+        first, second = Cards(), Cards()
+        budget.add(1, first, 1)
+        budget.add(1, second, 1)
+        budget.touch(1, first, 1)
+        budget.add(1, first, 2)
+        self.assertEqual(second.pages, ["page", None, "page"])
+
+        # The least recently used channel is forgotten along with its pages.
+        budget.add(2, second, 2)
+        budget.add(3, second, 0)
+        self.assertEqual(list(budget.channels), [2, 3])
+        self.assertEqual(first.pages, ["page", None, None])
+
+    def testSelectFromEvictedPage(self):
+        self.stub.search_total, self.stub.page_size = 40, 10
+        limit = scryfall.page_budget.limit
+        scryfall.page_budget.limit = 1
+        try:
+            handler = scryfall.ScryfallHandler({"scryfall": True})
+            (cards,) = self.resolve("[?t:elf]")
+            cards.channel_id = Channel.id
+            self.loop.run_until_complete(cards.show(2))
+
+            # Another search in the channel evicts the page being viewed.
+            (others,) = self.resolve("[?t:orc]")
+            others.channel_id = Channel.id
+            self.loop.run_until_complete(others.show(2))
+            self.assertIsNone(cards.pages[1])
+
+            message = Message(Channel())
+            sent = scryfall.SentCard(message, cards)
+            reaction = Reaction("1\ufe0f\u20e3", message)
+            self.loop.run_until_complete(
+                handler.handle_reaction(reaction, None, sent)
+            )
+            self.assertTrue(reaction.cleared)
+            self.assertEqual(message.embed.title, "t:elf 11")
+
+            # Let prefetches finish.
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.run_until_complete(
+                asyncio.gather(
+                    *cards.loading.values(), *others.loading.values()
+                )
+            )
+        finally:
+            self.stub.search_total, self.stub.page_size = 10, 175
+            scryfall.page_budget.limit = limit
+
+    def testDecklist(self):
+        lines = [f"4 Card {i}" for i in range(80)]
+        lines += ["", "Sideboard", "2x Card 1", "1 Island (M21) 264"]
+        lines += ["1 Nonexistent Card", "1 Card 2 [TST] 12 *F*", "1 card 3"]
+        lines += ["1 Forest (M21) 274 *F* *E*", "1 Fireball Art"]
+        deck = scryfall.Decklist("\n".join(lines))
+        self.assertEqual(deck.entries[("Card 1", None)], 6)
+        self.assertEqual(deck.entries[("Island", "M21")], 1)
+        self.assertEqual(deck.entries[("Card 2", "TST")], 1)
+        self.assertEqual(deck.entries[("Forest", "M21")], 1)
+        self.assertEqual(deck.missing, [])
+
+        self.loop.run_until_complete(deck.resolve())
+        self.assertEqual(
+            [r[0] for r in self.stub.requests], ["/cards/collection"] * 2
+        )
+        self.assertEqual(len(deck.cards), 85)
+        self.assertEqual(deck.missing, ["Nonexistent Card"])
+        self.assertEqual(deck.cards[80][1], "Island")
+        self.assertEqual(deck.cards[82], (1, "Card 3", 1.0))
+        self.assertEqual(deck.cards[-1][1], "Fireball Art")
+        self.assertAlmostEqual(deck.total_price(), 327)
+
+        embed = deck.get_embed()
+        self.assertTrue(embed.description.startswith("327 cards, $327.00"))
+        self.assertEqual(embed.fields[0].value, "Nonexistent Card")
+
+    def testRateLimiter(self):
+        limiter = scryfall.RateLimiter(rate=100, burst=2, max_waiting=2)
+
+        async def acquire_all():
+            return await asyncio.gather(
+                *[limiter.acquire() for _ in range(5)], return_exceptions=True
+            )
+
+        start = time.monotonic()
+        results = self.loop.run_until_complete(acquire_all())
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+        self.assertIsInstance(results[-1], scryfall.RateLimited)
+        self.assertEqual(limiter.rejected, 1)
+        self.assertEqual(limiter.acquired, 4)
+        self.assertEqual(limiter.peak_waiting, 2)
+        self.assertEqual(limiter.waiting, 0)
+
+    def testCoalescesRequests(self):
+        self.stub.latency = 0.05
+        try:
+            results = self.loop.run_until_complete(
+                asyncio.gather(
+                    *[q.get_result() for q in scryfall.get_queries("[ponder]")],
+                    *[q.get_result() for q in scryfall.get_queries("[PONDER]")],
+                )
+            )
+        finally:
+            self.stub.latency = 0
+        self.assertEqual([card.name for card in results], ["ponder"] * 2)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(scryfall.client.in_flight, {})
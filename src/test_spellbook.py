@@ -0,0 +1,299 @@
+import difflib
+import unittest
+
+import spellbook
+
+# Spell names from the SRD and elsewhere.
+NAMES = (
+    "Acid Arrow|Acid Splash|Aid|Alarm|Alter Self|Animal Friendship|Animal "
+    "Messenger|Animal Shapes|Animate Dead|Animate Objects|Antilife "
+    "Shell|Antimagic Field|Antipathy/Sympathy|Arcane Eye|Arcane Hand|Arcane"
+    " Lock|Arcane Sword|Arcanist's Magic Aura|Astral "
+    "Projection|Augury|Awaken|Bane|Banishment|Barkskin|Beacon of "
+    "Hope|Bestow Curse|Black Tentacles|Blade "
+    "Barrier|Bless|Blight|Blindness/Deafness|Blink|Blur|Branding "
+    "Smite|Burning Hands|Call Lightning|Calm Emotions|Chain Lightning|Charm"
+    " Person|Chill Touch|Circle of Death|Clairvoyance|Clone|Cloudkill|Color"
+    " Spray|Command|Commune|Commune with Nature|Comprehend "
+    "Languages|Compulsion|Cone of Cold|Confusion|Conjure Animals|Conjure "
+    "Celestial|Conjure Elemental|Conjure Fey|Conjure Minor "
+    "Elementals|Conjure Woodland Beings|Contact Other "
+    "Plane|Contagion|Contingency|Continual Flame|Control Water|Control "
+    "Weather|Counterspell|Create Food and Water|Create or Destroy "
+    "Water|Create Undead|Creation|Cure Wounds|Dancing "
+    "Lights|Darkness|Darkvision|Daylight|Death Ward|Delayed Blast "
+    "Fireball|Detect Evil and Good|Detect Magic|Detect Poison and "
+    "Disease|Detect Thoughts|Dimension Door|Disguise "
+    "Self|Disintegrate|Dispel Evil and Good|Dispel Magic|Divination|Divine "
+    "Favor|Divine Word|Dominate Beast|Dominate Monster|Dominate "
+    "Person|Dream|Druidcraft|Earthquake|Eldritch Blast|Enhance "
+    "Ability|Enlarge/Reduce|Entangle|Enthrall|Etherealness|Expeditious "
+    "Retreat|Eyebite|Fabricate|Faerie Fire|Faithful Hound|False "
+    "Life|Fear|Feather Fall|Feeblemind|Find Familiar|Find Steed|Find the "
+    "Path|Find Traps|Finger of Death|Fire Bolt|Fire Shield|Fire "
+    "Storm|Fireball|Flame Blade|Flame Strike|Flaming Sphere|Flesh to "
+    "Stone|Floating Disk|Fly|Fog "
+    "Cloud|Forbiddance|Forcecage|Foresight|Freedom of Movement|Freezing "
+    "Sphere|Gaseous Form|Gate|Geas|Gentle Repose|Giant "
+    "Insect|Glibness|Globe of Invulnerability|Glyph of "
+    "Warding|Goodberry|Grease|Greater Invisibility|Greater "
+    "Restoration|Guardian of Faith|Guards and Wards|Guidance|Guiding "
+    "Bolt|Gust of Wind|Hallow|Hallucinatory Terrain|Harm|Haste|Heal|Healing"
+    " Word|Heat Metal|Hellish Rebuke|Heroes' Feast|Heroism|Hideous "
+    "Laughter|Hold Monster|Hold Person|Holy Aura|Hunter's Mark|Hypnotic "
+    "Pattern|Ice Storm|Identify|Illusory Script|Imprisonment|Incendiary "
+    "Cloud|Inflict Wounds|Insect Plague|Instant "
+    "Summons|Invisibility|Irresistible Dance|Jump|Knock|Legend Lore|Lesser "
+    "Restoration|Levitate|Light|Lightning Bolt|Locate Animals or "
+    "Plants|Locate Creature|Locate Object|Longstrider|Mage Armor|Mage "
+    "Hand|Magic Circle|Magic Jar|Magic Missile|Magic Mouth|Magic "
+    "Weapon|Magnificent Mansion|Major Image|Mass Cure Wounds|Mass Heal|Mass"
+    " Healing Word|Mass Suggestion|Maze|Meld into "
+    "Stone|Mending|Message|Meteor Swarm|Mind Blank|Minor Illusion|Mirage "
+    "Arcane|Mirror Image|Mislead|Misty Step|Modify Memory|Moonbeam|Move "
+    "Earth|Nondetection|Pass without Trace|Passwall|Phantasmal "
+    "Killer|Phantom Steed|Planar Ally|Planar Binding|Plane Shift|Plant "
+    "Growth|Poison Spray|Polymorph|Power Word Heal|Power Word Kill|Power "
+    "Word Stun|Prayer of Healing|Prestidigitation|Prismatic Spray|Prismatic"
+    " Wall|Private Sanctum|Produce Flame|Programmed Illusion|Project "
+    "Image|Protection from Energy|Protection from Evil and Good|Protection "
+    "from Poison|Purify Food and Drink|Raise Dead|Ray of Enfeeblement|Ray "
+    "of Frost|Regenerate|Reincarnate|Remove Curse|Resilient "
+    "Sphere|Resistance|Resurrection|Reverse Gravity|Revivify|Rope "
+    "Trick|Sacred Flame|Sanctuary|Scorching Ray|Scrying|Secret Chest|See "
+    "Invisibility|Seeming|Sending|Sequester|Shapechange|Shatter|Shield|Shield"
+    " of Faith|Shillelagh|Shocking Grasp|Silence|Silent "
+    "Image|Simulacrum|Sleep|Sleet Storm|Slow|Spare the Dying|Speak with "
+    "Animals|Speak with Dead|Speak with Plants|Spider Climb|Spike "
+    "Growth|Spirit Guardians|Spiritual Weapon|Stinking Cloud|Stone "
+    "Shape|Stoneskin|Storm of "
+    "Vengeance|Suggestion|Sunbeam|Sunburst|Symbol|Telekinesis|Telepathic "
+    "Bond|Teleport|Teleportation Circle|Thaumaturgy|Thunderwave|Time "
+    "Stop|Tiny Hut|Tongues|Transport via Plants|Tree Stride|True "
+    "Polymorph|True Resurrection|True Seeing|True Strike|Unseen "
+    "Servant|Vampiric Touch|Vicious Mockery|Wall of Fire|Wall of Force|Wall"
+    " of Ice|Wall of Stone|Wall of Thorns|Warding Bond|Water "
+    "Breathing|Water Walk|Web|Weird|Wind Walk|Wind Wall|Wish|Word of "
+    "Recall|Zone of Truth|Melf's Acid Arrow|Tasha's Hideous "
+    "Laughter|Bigby's Hand|Otto's Irresistible Dance|Leomund's Tiny "
+    "Hut|Mordenkainen's Sword|Evard's Black Tentacles|Tenser's Floating "
+    "Disk"
+).split("|")
+
+# Queries people have made, typos and all.
+QUERIES = [
+    "fireball",
+    "firebal",
+    "fire ball",
+    "fierball",
+    "magic misile",
+    "magic missle",
+    "cure wound",
+    "heal",
+    "healing wrd",
+    "eldrich blast",
+    "eldritch",
+    "counter spell",
+    "counterspel",
+    "misty stp",
+    "sheild",
+    "hold persn",
+    "hold",
+    "bles",
+    "polymorf",
+    "telport",
+    "leomunds tiny hut",
+    "mordenkainen",
+    "spirit guardian",
+    "spiritual wepon",
+    "guidence",
+    "revivfy",
+    "dtect magic",
+    "dispell magic",
+    "magehand",
+    "slep",
+    "thunder wave",
+    "toll the dead",
+    "familiar",
+    "smite",
+    "hunters mark",
+    "vicious mocker",
+    "presti",
+    "prestidigitaton",
+    "lightening bolt",
+    "fire",
+    "wall",
+    "ice",
+    "the fireball spell",
+    "cast fireball",
+    "pwk",
+    "banish",
+    "featherfall",
+    "greater invis",
+    "invis",
+    "mass cure",
+    "res",
+    "true res",
+    "speak with the dead",
+    "sugestion",
+    "tashas hideous laughter",
+    "evards",
+    "bigbys hand",
+    "xyzzy",
+    "evard",
+    "raise",
+    "drawmijs",
+    "unseen",
+    "toll the dead",
+    "magic",
+    "cone of colf",
+    "sacred",
+    "shilelagh",
+    "good berry",
+    "moon beam",
+]
+
+
+class TestSpellIndex(unittest.TestCase):
+    def testMatchesDifflib(self):
+        index = spellbook.SpellIndex(NAMES)
+        names = [name.lower() for name in NAMES]
+        for query in QUERIES:
+            expected = difflib.get_close_matches(query, names, 1)
+            found = index.get(query)
+            self.assertEqual(
+                found.lower() if found else None,
+                expected[0] if expected else None,
+                query,
+            )
+
+    def testExact(self):
+        index = spellbook.SpellIndex(["Fireball", "Melf's Acid Arrow"])
+        self.assertEqual(index.get("FIREBALL"), "Fireball")
+        self.assertEqual(index.get("melf's acid arrow"), "Melf's Acid Arrow")
+        self.assertEqual(index.get("acid arrow"), "Melf's Acid Arrow")
+
+
+SPELLS = [
+    {
+        "name": "Fireball",
+        "level": 3,
+        "school": "Evocation",
+        "classes": ["Sorcerer", "Wizard"],
+        "subclasses": ["Light Domain"],
+        "description": "A bright streak flashes from your pointing finger "
+        "to a point you choose then blossoms with a low roar into an "
+        "explosion of flame. Each creature in a 20-foot-radius sphere must "
+        "make a Dexterity saving throw, taking fire damage on a failed save.",
+    },
+    {
+        "name": "Leomund's Tiny Hut",
+        "level": 3,
+        "school": "Evocation",
+        "ritual": True,
+        "classes": ["Bard", "Wizard"],
+        "alt_names": ["Tiny Hut"],
+        "description": "A 10-foot-radius immobile dome of force springs "
+        "into existence around and above you. Creatures and objects within "
+        "the dome when you cast this spell can move through it freely.",
+    },
+    {
+        "name": "Detect Magic",
+        "level": 1,
+        "school": "Divination",
+        "ritual": True,
+        "classes": ["Bard", "Cleric", "Wizard"],
+    },
+    {
+        "name": "Find Familiar",
+        "level": 1,
+        "school": "Conjuration",
+        "ritual": True,
+        "description": "You gain the service of a familiar, a spirit that "
+        "takes an animal form you choose.",
+    },
+    {
+        "name": "Fire Bolt",
+        "level": 0,
+        "school": "Evocation",
+        "classes": ["Sorcerer", "Wizard"],
+        "description": "You hurl a mote of fire at a creature or object "
+        "within range. A flammable object hit by this spell ignites.",
+    },
+]
+
+
+class TestSpellbook(unittest.TestCase):
+    def setUp(self):
+        self.sb = spellbook.Spellbook(SPELLS)
+
+    def testFilters(self):
+        facets = self.sb.facets
+        self.assertIsNone(facets.parse("fireball"))
+        self.assertIsNone(facets.parse("level:3 fireball"))
+        self.assertEqual(
+            facets.parse('Level:3rd subclass:"light domain" ritual'),
+            [("level", "3"), ("subclass", "light domain"), ("ritual", None)],
+        )
+
+        def names(query):
+            return facets.filter(facets.parse(query))
+
+        self.assertEqual(
+            names("class:wizard"),
+            ["Fire Bolt", "Detect Magic", "Fireball", "Leomund's Tiny Hut"],
+        )
+        self.assertEqual(
+            names("level:3 school:evocation ritual"), ["Leomund's Tiny Hut"]
+        )
+        self.assertEqual(names("level:cantrip"), ["Fire Bolt"])
+        self.assertEqual(names('subclass:"light domain"'), ["Fireball"])
+        self.assertEqual(names("class:paladin ritual"), [])
+
+    def testFilterEmbeds(self):
+        embeds = self.sb.handle_command("ritual")
+        self.assertEqual(embeds[0].title, '3 spells matching "ritual"')
+        self.assertEqual(
+            embeds[0].description,
+            "Detect Magic (1st Level)\nFind Familiar (1st Level)\n"
+            "Leomund's Tiny Hut (3rd Level)\n",
+        )
+        self.assertIsInstance(self.sb.handle_command("class:druid"), str)
+
+        names = [f"Spell {i:03}" for i in range(200)]
+        self.sb.spells = {
+            name: spellbook.Spell(name=name, level=1) for name in names
+        }
+        embeds = self.sb.list_embeds("Spells", names)
+        self.assertGreater(len(embeds), 1)
+        self.assertTrue(
+            all(
+                len(e.description) <= spellbook.Spellbook.EMBED_LENGTH
+                for e in embeds
+            )
+        )
+        self.assertEqual(
+            "".join(e.description for e in embeds).count("\n"), len(names)
+        )
+
+    def testSearch(self):
+        text = self.sb.text
+        self.assertEqual(text.search("fire damage explosion")[0], "Fireball")
+        self.assertEqual(text.search("Fire")[:2], ["Fire Bolt", "Fireball"])
+        self.assertEqual(text.search("creatures dome")[0], "Leomund's Tiny Hut")
+        self.assertEqual(len(text.search("creatures dome")), 3)
+        self.assertEqual(text.search("the of"), [])
+
+        embed = self.sb.handle_command("find a flaming dome")
+        self.assertEqual(embed.title, 'Spells about "a flaming dome"')
+        self.assertTrue(
+            embed.description.startswith(
+                "1. Leomund's Tiny Hut (3rd Level Evocation, Ritual)"
+            )
+        )
+        self.assertEqual(
+            self.sb.handle_command("Find Fam").title, "Find Familiar"
+        )
+        self.assertEqual(
+            self.sb.handle_command("find familiar").title, "Find Familiar"
+        )
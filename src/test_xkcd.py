@@ -0,0 +1,211 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import aiohttp
+
+import database
+import stub_xkcd
+import utilities
+import xkcd
+
+
+class Client:
+    # Stands in for discord.Client, closing after checks calls to is_closed.
+    def __init__(self, checks):
+        self.checks = checks
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_closed(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+class TestXKCD(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.dir = tempfile.TemporaryDirectory()
+        utilities.set_log_file(os.path.join(cls.dir.name, ".log"))
+        xkcd.init_db()
+        cls.loop.run_until_complete(
+            database.init_db(os.path.join(cls.dir.name, "test.db"))
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(database.database.close())
+        cls.loop.close()
+        cls.dir.cleanup()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def sync(self, updater):
+        async def sync():
+            async with aiohttp.ClientSession() as session:
+                return await updater.sync(session)
+
+        return self.run_async(sync())
+
+    def testSharesInterface(self):
+        db = xkcd.db
+        commands = list(database.database.startup_commands)
+        xkcd.init_db()
+        self.assertIs(xkcd.db, db)
+        self.assertEqual(database.database.startup_commands, commands)
+
+    def testIncrementalSync(self):
+        stub = stub_xkcd.StubXKCD(newest=6, flaky={3: 1, 4: 5})
+        self.run_async(stub.start())
+        try:
+            updater = xkcd.Updater(stub.url, retry_delay=0.001)
+            self.run_async(xkcd.titles.load())
+
+            # Comic 3 succeeds on its second attempt, comic 4 on no attempt.
+            strips = self.sync(updater)
+            self.assertEqual(sorted(s.idno for s in strips), [1, 2, 3, 5, 6])
+            self.assertEqual(updater.failed, {4})
+
+            # The feed is unchanged, so only comic 4 is fetched again.
+            stub.requests.clear()
+            strips = self.sync(updater)
+            self.assertEqual([s.idno for s in strips], [4])
+            self.assertEqual(stub.requests[0], "/info.0.json")
+            self.assertEqual(set(stub.requests[1:]), {"/4/info.0.json"})
+            self.assertEqual(updater.failed, set())
+
+            stub.requests.clear()
+            self.assertEqual(self.sync(updater), [])
+            self.assertEqual(stub.requests, ["/info.0.json"])
+
+            stub.add(stub_xkcd.comic_json(7, "Newest Comic"))
+            stub.add(stub_xkcd.comic_json(8, "Don't Panic"))
+            stub.requests.clear()
+            strips = self.sync(updater)
+            self.assertEqual(stub.requests, ["/info.0.json", "/7/info.0.json"])
+
+            self.assertEqual(xkcd.titles.lookup("Don't Panic"), 8)
+            self.assertEqual(sorted(xkcd.titles.comic_ids), list(range(1, 9)))
+            embed = self.run_async(xkcd.get_xkcd("random"))
+            self.assertRegex(embed.title, r"\| [1-8]$")
+
+            db = xkcd.db
+            self.assertEqual(self.run_async(db.get_max_id()), 8)
+            self.assertEqual(
+                self.run_async(db.get_xkcd("don&#39;t panic"))[0],
+                "Don't Panic | 8",
+            )
+        finally:
+            self.run_async(stub.stop())
+
+    def testMalformedComics(self):
+        stub = stub_xkcd.StubXKCD(newest=20)
+        stub.add("{not json", idno=12)
+        stub.add({"num": 13, "safe_title": "No Image"})
+        self.run_async(stub.start())
+        default = xkcd.updater
+        try:
+            updater = xkcd.Updater(stub.url, retry_delay=0.001)
+            self.run_async(xkcd.titles.load())
+            self.run_async(xkcd.db.insert_xkcds([xkcd.xkcd(10, "comic 10")]))
+
+            strips = self.sync(updater)
+            self.assertEqual(
+                sorted(s.idno for s in strips), [11, 14, 15, 16, 17, 18, 19, 20]
+            )
+            self.assertEqual(updater.failed, {12, 13})
+
+            # A malformed newest comic is fetched again on the next sync,
+            # even though the feed's ETag is unchanged.
+            stub.add({"num": 21, "safe_title": "No Image"})
+            with self.assertRaises(KeyError):
+                self.sync(updater)
+            stub.add(stub_xkcd.comic_json(21))
+            strips = self.sync(updater)
+            self.assertEqual([s.idno for s in strips], [21])
+            self.assertEqual(self.run_async(xkcd.db.get_max_id()), 21)
+
+            # Nor do malformed comics stop periodic updates.
+            stub.add("{not json", idno=22)
+            stub.requests.clear()
+            xkcd.updater = updater
+            self.run_async(xkcd.update_periodically(0, Client(checks=3)))
+            self.assertEqual(stub.requests.count("/info.0.json"), 3)
+        finally:
+            xkcd.updater = default
+            self.run_async(stub.stop())
+
+    def testTitleIndex(self):
+        titles = xkcd.TitleIndex()
+        titles.add(936, "password strength")
+        titles.add(327, "exploits of a mom")
+        titles.add(1053, "ten thousand")
+        titles.add(8, "don&#39;t panic")
+
+        self.assertEqual(titles.lookup("Password Strength"), 936)
+        self.assertEqual(titles.lookup("don't panic"), 8)
+        self.assertIsNone(titles.lookup("password"))
+        self.assertEqual(titles.suggest("pasword strenght"), 936)
+        self.assertEqual(titles.suggest("exploits of mom"), 327)
+        self.assertIsNone(titles.suggest("zzzzzz"))
+
+        titles.add(8, "don&#39;t panic")
+        self.assertEqual(sorted(titles.comic_ids), [8, 327, 936, 1053])
+
+    def testSearch(self):
+        db = xkcd.db
+        self.run_async(
+            db.insert_xkcds(
+                [
+                    xkcd.xkcd.from_json(data)
+                    for data in [
+                        stub_xkcd.comic_json(
+                            936,
+                            "Password Strength",
+                            "To anyone who understands information theory "
+                            "and security...",
+                        ),
+                        stub_xkcd.comic_json(
+                            792, "Password Reuse", "It's not the passwords."
+                        ),
+                        stub_xkcd.comic_json(
+                            1053,
+                            "Ten Thousand",
+                            "Saying 'what kind of "
+                            "an idiot doesn't know about passwords'...",
+                        ),
+                        stub_xkcd.comic_json(
+                            327,
+                            "Exploits of a Mom",
+                            "Her daughter is "
+                            "named Help I'm trapped in a driver's license "
+                            "factory.",
+                        ),
+                    ]
+                ]
+            )
+        )
+
+        names = [r[0] for r in self.run_async(db.search_xkcds("passwords"))]
+        self.assertEqual(len(names), 3)
+        self.assertEqual(
+            set(names[:2]), {"Password Strength | 936", "Password Reuse | 792"}
+        )
+        self.assertEqual(names[2], "Ten Thousand | 1053")
+
+        embed = self.run_async(xkcd.get_xkcd("search driving licenses"))
+        self.assertEqual(embed.title, "Exploits of a Mom | 327")
+        self.assertEqual(self.run_async(db.search_xkcds("?!")), [])
+
+        self.run_async(
+            database.database.execute(
+                "DELETE FROM xkcds WHERE id = 327;",
+                trans_type=database.TransTypes.COMMIT,
+            )
+        )
+        self.assertEqual(self.run_async(db.search_xkcds("factory")), [])
@@ -1,13 +1,11 @@
 import asyncio  # More efficiently collect xkcds
-import concurrent.futures
+import collections
 import difflib  # Get similarly named comics
-import re  # Parse xkcd html for relevant data
-import sys
-import threading
-import time
+import heapq
+import random
 
+import aiohttp  # Pull raw data from xkcd website
 import discord
-import requests  # Pull raw data from xkcd website
 
 import database
 import utilities  # Send messages in the log
@@ -21,67 +19,58 @@ class xkcd:
         self.alt = alt
 
     @staticmethod
-    def from_raw_name(name):
-        temp = ""
-        strip = xkcd()
-        for c in name:
-            # / means the comic number has ended. Some titles also have a /, so
-            # ignore / after the first
-            if c == "/" and not strip.idno:
-                strip.idno = temp
-                temp = ""
-            elif c == ">":  # > is the beginning of the name
-                temp = ""
-            elif c == "<":  # < is the end of the name
-                strip.name = temp.lower().replace(
-                    "'", "&#39;"
-                )  # &#39; is a placeholder for ' for it to work in the database
-            else:
-                temp += c
-        return strip
-
-    def get_uri_alt(self):
-        r = requests.get(
-            f"http://xkcd.com/{self.idno}"
-        )  # Grab source of comic's page
-        src = r.content.decode()  # Decode from raw binary
-
-        uri = re.search(
-            r"https://imgs\.xkcd\.com/comics/[\w.()-]+", src
-        )  # Pull the permalink
-        if uri:
-            uri = uri.group(0)
-            self.uri = uri
-
-        alt = re.search(
-            r"<img src=\"[^\"]+\" title=\"[^\"]+\"", src
-        )  # Pull the alt text
-        if alt:
-            alt = re.search('title="[^"]+"', alt.group(0)).group(
-                0
-            )  # Grab the title section of the line
-            alt = alt[7 : len(alt) - 1]  # Trim down to just the text
-            self.alt = alt
-
-        return self
+    def from_json(data):
+        return xkcd(
+            data["num"],
+            # &#39; is a placeholder for ' for it to work in the database
+            data["safe_title"].lower().replace("'", "&#39;"),
+            data["img"],
+            data["alt"],
+        )
 
 
 async def get_xkcd(query):
-    db = database.XKCD_Database()
     query = query.lower()
     if query == "random":
-        xkcd_tuple = await db.get_random_xkcd()
+        if not titles.loaded:
+            await titles.load()
+        ids = titles.comic_ids
+        # get_id falls back to our 404 comic if there are none
+        xkcd_tuple = await db.get_id(random.choice(ids) if ids else 0)
     elif query in ["new", "newest"]:
         xkcd_tuple = await db.get_newest_xkcd()
+    elif query.startswith("search "):
+        return await search(query[len("search ") :])
     elif query.isnumeric():
         xkcd_tuple = await db.get_id(query)
-    elif await list_check(query):
-        xkcd_tuple = await db.get_xkcd(query)
     else:
-        xkcd_tuple = await db.get_xkcd(await sugg(query))
+        if not titles.loaded:
+            await titles.load()
+        idno = titles.lookup(query)
+        if idno is None:
+            idno = titles.suggest(query)
+
+        if idno is None:
+            # the comic "not available" is our 404 message
+            xkcd_tuple = await db.get_xkcd("not available")
+        else:
+            xkcd_tuple = await db.get_id(idno)
     return get_embed(xkcd_tuple)
 
 
+async def search(words):
+    results = await db.search_xkcds(words)
+    if not results:
+        return f"I couldn't find any comics about {words.strip()}."
+
+    e = get_embed(results[0])
+    if len(results) > 1:
+        e.description = "Other matches: " + ", ".join(
+            name for name, _, _ in results[1:]
+        )
+    return e
+
+
 def get_embed(xkcd_tuple):
     e = discord.Embed(title=xkcd_tuple[0])
     e.set_image(url=xkcd_tuple[1])
@@ -89,82 +78,209 @@ def get_embed(xkcd_tuple):
     return e
 
 
-async def update_db(loop):
-    current = await get_list()  # list of comics currently in the database
-    db = database.XKCD_Database()
-    r = requests.get(
-        "https://xkcd.com/archive/"
-    )  # Grab the archive page, a list of all xkcd comics
-    raw_names = re.findall(
-        r'[0-9]{0,4}/" title="[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}">[^<>]+<',
-        r.content.decode(),
-    )  # Grab sections of html containing names
-    xkcds = []
-    for name in raw_names:
-        strip = xkcd.from_raw_name(
-            name
-        )  # Create an xkcd object from the raw data
-        if (
-            not strip.name in current
-        ):  # We only need to add comics we don't have
-            xkcds.append(strip)
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        calls = [
-            loop.run_in_executor(executor, strip.get_uri_alt) for strip in xkcds
-        ]
-
-    strips = await asyncio.gather(*calls)
-
-    for strip in strips:  # Run calls
-        await db.insert_xkcd(strip)  # Add to db
-        utilities.log_message(f"Added new xkcd comic {strip.name}.")
-
-    utilities.log_message("xkcd database up to date!")
-
+class TitleIndex:
+    # Comic titles and ids held in memory. Close matches to a title are found
+    # by counting shared trigrams, so that only the CANDIDATES best of those
+    # need to be compared with difflib.
 
-async def get_list():  # Grab the list of names of xkcds
-    db = database.XKCD_Database()
-    return await db.get_xkcd_list()
+    CANDIDATES = 5
+    MIN_RATIO = 0.5  # Suggestions must be at least 50% similar
 
+    def __init__(self):
+        self.ids = {}  # title: id
+        self.trigrams = collections.defaultdict(set)  # trigram: titles
+        self.sizes = {}  # title: number of trigrams
+        self.comic_ids = []  # id of every comic, to pick random comics from
+        self.known_ids = set()
+        self.loaded = False
 
-async def list_check(query):  # Ensure we have the xkcd of name 'query'
-    if query in await get_list():
-        return True
-    return False
-
-
-async def sugg(query):
-    best = 0.5  # Suggestions must be at least 50% similar
-    best_name = "not available"  # the comic "not available" is our 404 message
-    for name in await get_list():
-        r = difflib.SequenceMatcher(a=name, b=query).ratio()
-        if r > best:
-            best = r
-            best_name = name
-    return best_name
-
-
-def update_db_schedule(interval, client):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    while not client.is_ready():
-        time.sleep(0.5)
-
-    while not client.is_closed():
-        loop.run_until_complete(update_db(loop))
-        time.sleep(interval)
-    sys.exit()
-
+    @staticmethod
+    def key(name):
+        return name.lower().replace("&#39;", "'").replace("&quot;", '"')
 
-def start_db_thread(interval, client):
-    thread = threading.Thread(
-        target=update_db_schedule, args=[interval, client]
-    )
-    thread.start()
-    utilities.log_message("Started XKCD update thread.")
+    @staticmethod
+    def get_trigrams(title):
+        padded = f"  {title} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, idno, name):
+        if idno not in self.known_ids:
+            self.known_ids.add(idno)
+            self.comic_ids.append(idno)
+
+        title = TitleIndex.key(name)
+        self.ids[title] = idno
+        trigrams = TitleIndex.get_trigrams(title)
+        self.sizes[title] = len(trigrams)
+        for trigram in trigrams:
+            self.trigrams[trigram].add(title)
+
+    async def load(self):
+        for idno, name in await db.get_xkcd_titles():
+            self.add(idno, name)
+        self.loaded = True
+
+    def lookup(self, query):
+        return self.ids.get(TitleIndex.key(query))
+
+    def suggest(self, query):
+        query = TitleIndex.key(query)
+        trigrams = TitleIndex.get_trigrams(query)
+        shared = collections.Counter()
+        for trigram in trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+
+        # Rank by the Jaccard similarity of the trigram sets.
+        candidates = heapq.nlargest(
+            TitleIndex.CANDIDATES,
+            shared,
+            key=lambda t: shared[t]
+            / (len(trigrams) + self.sizes[t] - shared[t]),
+        )
+
+        best, best_title = TitleIndex.MIN_RATIO, None
+        for title in candidates:
+            r = difflib.SequenceMatcher(a=title, b=query).ratio()
+            if r > best:
+                best, best_title = r, title
+        return self.ids.get(best_title)
+
+
+titles = TitleIndex()
+
+
+class Updater:
+    # Keeps the database in step with xkcd's JSON API. The newest comic is
+    # requested conditionally, so when nothing has changed a sync costs one
+    # small request. Comics which fail to download are retried with backoff,
+    # then again on the next sync. The validators of a new version of the
+    # feed are only kept once its comics are stored, so that a failed sync
+    # is repeated in full rather than answered with 304.
+
+    BASE_URL = "https://xkcd.com/"
+    CONCURRENCY = 8  # number of comics to fetch at once
+    RETRIES = 3  # attempts to fetch each comic in a sync
+    RETRY_DELAY = 1  # seconds, doubled after each failed attempt
+    TIMEOUT = 30  # seconds
+
+    def __init__(self, base_url=BASE_URL, retry_delay=RETRY_DELAY):
+        self.base_url = base_url
+        self.retry_delay = retry_delay
+        self.etag = None
+        self.last_modified = None
+        self.failed = set()  # ids of comics to retry on the next sync
+
+    # Returns the newest comic and the validators of the response, or None
+    # if it is unchanged.
+    async def get_newest(self, session):
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        async with session.get(
+            self.base_url + "info.0.json", headers=headers
+        ) as resp:
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+            validators = (
+                resp.headers.get("ETag"),
+                resp.headers.get("Last-Modified"),
+            )
+        return data, validators
+
+    async def get_comic(self, session, idno):
+        for attempt in range(Updater.RETRIES):
+            try:
+                async with session.get(
+                    f"{self.base_url}{idno}/info.0.json"
+                ) as resp:
+                    if resp.status == 404:  # there is no comic 404
+                        return None
+                    resp.raise_for_status()
+                    return xkcd.from_json(await resp.json(content_type=None))
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == Updater.RETRIES - 1:
+                    raise
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+
+    async def sync(self, session):
+        ids = set(self.failed)
+        strips = []
+        validators = None
+
+        response = await self.get_newest(session)
+        if response is not None:
+            newest, validators = response
+            max_id = await db.get_max_id()
+            if max_id is None:
+                raise ValueError("Failed to read the newest stored xkcd.")
+            ids.update(range(max_id + 1, newest["num"]))
+            ids.discard(newest["num"])
+            strips.append(xkcd.from_json(newest))
+
+        semaphore = asyncio.Semaphore(Updater.CONCURRENCY)
+        self.failed = set()
+
+        async def fetch(idno):
+            async with semaphore:
+                try:
+                    return await self.get_comic(session, idno)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    utilities.log_message(f"Failed to fetch xkcd {idno}: {e}")
+                    self.failed.add(idno)
+                except (ValueError, KeyError) as e:
+                    utilities.log_message(f"Bad data for xkcd {idno}: {e!r}")
+                    self.failed.add(idno)
+
+        fetched = await asyncio.gather(*[fetch(idno) for idno in sorted(ids)])
+        strips.extend(strip for strip in fetched if strip is not None)
+        if strips:
+            # Add to db in one transaction
+            if not await db.insert_xkcds(strips):
+                self.failed.update(strip.idno for strip in strips)
+                raise ValueError("Failed to store xkcd comics.")
+            if titles.loaded:
+                for strip in strips:
+                    titles.add(strip.idno, strip.name)
+            utilities.log_message(f"Added {len(strips)} xkcd comics.")
+        if validators is not None:
+            self.etag, self.last_modified = validators
+
+        utilities.log_message("xkcd database up to date!")
+        return strips
+
+
+updater = Updater()
+
+
+# Runs on the bot's event loop until the client closes. The session is closed
+# on the way out, including when the task is cancelled at shutdown.
+async def update_periodically(interval, client):
+    await client.wait_until_ready()
+    async with aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=Updater.TIMEOUT)
+    ) as session:
+        while not client.is_closed():
+            try:
+                await updater.sync(session)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                utilities.log_message(f"Failed to update xkcd database: {e}")
+            except (ValueError, KeyError) as e:
+                utilities.log_message(f"Bad data from xkcd: {e!r}")
+            await asyncio.sleep(interval)
+    utilities.log_message("Stopped xkcd updates.")
+
+
+# The interface is created once, as each instance adds the xkcd tables to the
+# database's startup commands.
+db = None
 
 
 def init_db():
-    database.XKCD_Database()
+    global db
+    if db is None:
+        db = database.XKCD_Database()